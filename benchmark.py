@@ -0,0 +1,177 @@
+#!/usr/bin/env python3
+import sys
+import time
+import timeit
+from datetime import datetime, timedelta
+import markdown
+
+import credcast
+
+SAMPLE_POST = """Some *emphasis*, a [link](https://cred.at) and "smart quotes".
+
+## Section
+
+| a | b |
+|---|---|
+| 1 | 2 |
+
+```python
+def hello_world():
+    print("Hello from cred.at!")
+```
+"""
+
+def bench_renderer(number=500):
+    """Compare per-document cost of markdown.markdown() against the reused renderer"""
+    def fresh():
+        markdown.markdown(
+            SAMPLE_POST,
+            extensions=credcast.markdown_extensions(),
+            extension_configs=credcast.MARKDOWN_EXTENSION_CONFIGS
+        )
+
+    renderer = credcast.MarkdownRenderer()
+
+    def warm():
+        renderer.render(SAMPLE_POST)
+
+    # Build the extension chain once so the warm case measures steady state
+    warm()
+
+    fresh_time = min(timeit.repeat(fresh, number=number, repeat=3)) / number
+    warm_time = min(timeit.repeat(warm, number=number, repeat=3)) / number
+
+    print(f"markdown.markdown():       {fresh_time * 1e6:8.1f} us/doc")
+    print(f"MarkdownRenderer.render(): {warm_time * 1e6:8.1f} us/doc")
+    print(f"Per-document overhead saved: {(fresh_time - warm_time) * 1e6:.1f} us ({fresh_time / warm_time:.1f}x)")
+
+def make_posts(count):
+    """Return count synthetic posts, newest first"""
+    start = datetime(2000, 1, 1)
+    posts = []
+    for i in range(count):
+        post = credcast.Post(f"Post number {i}", start + timedelta(days=i), ['bench'], f"post-{i}.md")
+        post.content = "<p>Short body.</p>"
+        posts.append(post)
+    posts.reverse()
+    return posts
+
+def bench_sidebar(sizes=(250, 500, 1000, 2000)):
+    """Compare generating every page with a per-page sidebar against the shared one
+
+    The shared sidebar is formatted once; what remains per page is copying
+    its bytes into the page, which grows with the sidebar size shown.
+    """
+    print(f"{'posts':>6} {'per-page sidebar':>18} {'shared sidebar':>16} {'sidebar size':>14}")
+    for count in sizes:
+        posts = make_posts(count)
+
+        start = time.perf_counter()
+        for post in posts:
+            credcast.generate_post_html(post, posts, 'bench.cred.at')
+        per_page = time.perf_counter() - start
+
+        start = time.perf_counter()
+        post_links = credcast.PostLinks(posts)
+        for post in posts:
+            credcast.generate_post_html(post, posts, 'bench.cred.at', post_links)
+        shared = time.perf_counter() - start
+
+        print(f"{count:>6} {per_page / count * 1e6:>12.1f} us/pg {shared / count * 1e6:>10.1f} us/pg"
+              f" {len(post_links.html) / 1024:>11.0f} KB")
+
+UNLABELED_POST = """```
+import os
+
+def hello_world(path):
+    return os.path.join(path, "hello")
+```
+"""
+
+def bench_unlabeled(number=20):
+    """Compare rendering a code block without a language under each --unlabeled-code policy"""
+    renderer = credcast.markdown_renderer
+    for policy in ('guess', 'plain', 'python'):
+        credcast.set_unlabeled_code(policy)
+        renderer.render(UNLABELED_POST)
+        seconds = min(timeit.repeat(lambda: renderer.render(UNLABELED_POST), number=number, repeat=3)) / number
+        print(f"{policy:>8}: {seconds * 1e6:10.1f} us/block")
+    credcast.set_unlabeled_code('guess')
+
+FENCED_POST = """```{.python linenums="true"}
+def hello_world():
+    print("Hello from cred.at!")
+```
+
+```{.python linenums="true" linenostart="10" hl_lines="2"}
+def hello_world():
+    print("Hello from cred.at!")
+```
+
+```{.python #hello .example hl_lines="1 2"}
+def hello_world():
+    print("Hello from cred.at!")
+```
+
+```{.python use_pygments=false data-line="2"}
+def hello_world():
+    print("Hello from cred.at!")
+```
+
+```python hl_lines="1"
+def hello_world():
+    print("Hello from cred.at!")
+```
+
+```{.cred .example}
+cred@github:repo:cred-at-collective/credcast
+```
+"""
+
+def bench_fenced(number=50):
+    """Compare fenced blocks with attributes through credcast's extensions and the stock ones
+
+    The output has to match stock markdown.markdown() exactly.
+    """
+    stock_names = {'credcast.codehilite': 'codehilite', 'credcast.fenced_code': 'fenced_code'}
+    stock_extensions = [stock_names.get(name, name) for name in credcast.MARKDOWN_EXTENSIONS]
+    stock_configs = {stock_names.get(name, name): config for name, config in credcast.MARKDOWN_EXTENSION_CONFIGS.items()}
+
+    def stock():
+        return markdown.markdown(FENCED_POST, extensions=stock_extensions, extension_configs=stock_configs)
+
+    def cached():
+        return markdown.markdown(
+            FENCED_POST,
+            extensions=credcast.markdown_extensions(),
+            extension_configs=credcast.MARKDOWN_EXTENSION_CONFIGS
+        )
+
+    if cached() != stock():
+        print("Error: fenced code output differs from stock markdown.markdown()")
+        sys.exit(1)
+
+    stock_time = min(timeit.repeat(stock, number=number, repeat=3)) / number
+    cached_time = min(timeit.repeat(cached, number=number, repeat=3)) / number
+    print(f"stock extensions:    {stock_time * 1e6:8.1f} us/doc")
+    print(f"credcast extensions: {cached_time * 1e6:8.1f} us/doc (output identical)")
+
+BENCHMARKS = {
+    'renderer': bench_renderer,
+    'sidebar': bench_sidebar,
+    'unlabeled': bench_unlabeled,
+    'fenced': bench_fenced,
+}
+
+def main():
+    """Run the named benchmarks, or all of them"""
+    names = sys.argv[1:] or list(BENCHMARKS)
+    for name in names:
+        if name not in BENCHMARKS:
+            print(f"Unknown benchmark: {name} (choose from {', '.join(BENCHMARKS)})")
+            sys.exit(1)
+        print(f"== {name} ==")
+        BENCHMARKS[name]()
+
+if __name__ == "__main__":
+    main()
@@ -4,19 +4,187 @@ import os
 import sys
 import shutil
 import subprocess
+import shlex
 import re
+import html as html_lib
+import json
+import time
+import errno
+import select
+import struct
+import ctypes
+import ctypes.util
+import pickle
+import hashlib
+import gzip
+import filecmp
+import threading
+import traceback
+import mimetypes
+import multiprocessing
+import urllib.parse
+from collections import OrderedDict, deque
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from concurrent.futures import ProcessPoolExecutor
 import yaml
 import markdown
+from markdown.extensions import codehilite, fenced_code
+from markdown.extensions.attr_list import AttrListExtension, get_attrs_and_remainder
+from markdown.serializers import _escape_attrib_html as escape_attrib_html
 from dateutil import parser as dateutil_parser
-from markdown.extensions.codehilite import CodeHiliteExtension
-from markdown.extensions.fenced_code import FencedCodeExtension
-from datetime import datetime
+import pygments
+from pygments.formatters import HtmlFormatter
+from pygments.lexers import get_all_lexers, get_lexer_by_name
+from pygments.util import ClassNotFound
+try:
+    from PIL import Image, ImageOps
+except ImportError:
+    # Pillow is only needed for --responsive-images
+    Image = None
+try:
+    import brotli
+except ImportError:
+    # Without brotli, --precompress only writes .gz files
+    brotli = None
+try:
+    import latex2mathml.converter
+except ImportError:
+    # Without latex2mathml, math is left for MathJax to typeset in the browser
+    latex2mathml = None
+from datetime import date, datetime
 import argparse
 
 """
 credcast.py - A simple static site generator for cred.at blogs
 """
 
+# Modules imported once by the forkserver before --jobs workers are started
+RENDER_PRELOAD_MODULES = ['markdown', 'pygments', 'yaml', 'dateutil.parser']
+
+# Markdown extensions used to render posts. These are also hashed into the
+# render cache key, so changing them invalidates cached posts. The credcast.*
+# names are the codehilite and fenced_code subclasses in CREDCAST_EXTENSIONS.
+MARKDOWN_EXTENSIONS = [
+    'markdown.extensions.extra',
+    'markdown.extensions.smarty',
+    'markdown.extensions.toc',
+    'credcast.codehilite',
+    'credcast.fenced_code'
+]
+MARKDOWN_EXTENSION_CONFIGS = {
+    'credcast.codehilite': {'css_class': 'highlight'}
+}
+
+# TeX math in posts: $$display$$ and $inline$. An inline $ must hug its
+# content and the closing one must not be followed by a digit, so prices
+# like "$5 and $10" are left alone.
+MATH_RE = re.compile(r'\$\$(.+?)\$\$|(?<![\\$\w])\$(?=\S)([^$\n]*?[^\s\\])\$(?![\d$])', re.S)
+# Code in Markdown source (fenced blocks, indented blocks, code spans), where $ is not math
+MARKDOWN_CODE_RE = re.compile(
+    r'^(`{3,}|~{3,})[^\n]*\n.*?^\1[ \t]*$'
+    r'|(?:^[ \t]*\n)(?:(?: {4}|\t)[^\n]*(?:\n|\Z))+'
+    r'|(`+).+?\2',
+    re.M | re.S
+)
+# Code in rendered HTML, skipped when looking for math left for MathJax
+HTML_CODE_RE = re.compile(r'<(pre|code)\b.*?</\1>', re.S)
+# Stand-ins for converted math while Markdown runs: private use characters,
+# which Markdown leaves alone and the toc extension drops from heading ids
+MATH_PLACEHOLDER_RE = re.compile('\ue000[\ue010-\ue019]+\ue001')
+# A tag in rendered HTML, whose attributes must not receive MathML
+HTML_TAG_RE = re.compile(r'<(?:[^>"\']|"[^"]*"|\'[^\']*\')*>')
+
+# libyaml's C loader is much faster, use it when PyYAML was built with it
+YAML_LOADER = getattr(yaml, 'CSafeLoader', yaml.SafeLoader)
+
+# How much of each file the metadata scan reads looking for the end of the front matter
+FRONT_MATTER_READ_SIZE = 8 * 1024
+
+# Image files copied from the content directory into img/
+IMAGE_EXTENSIONS = ['.jpg', '.jpeg', '.png', '.gif', '.svg']
+
+# Images that --responsive-images makes resized variants of, into img/<width>/
+RESPONSIVE_IMAGE_EXTENSIONS = ['.jpg', '.jpeg', '.png']
+DEFAULT_IMAGE_WIDTHS = '480,960,1600'
+IMAGE_QUALITY = 80
+IMAGE_VARIANTS_VERSION = 1
+# The content column is at most 800px wide
+IMAGE_SIZES = '(max-width: 800px) 100vw, 800px'
+# Source stat and variants of every image, so unchanged images are not reopened
+IMAGE_INDEX_FILE = '.credcast-images.json'
+# An <img> tag showing a file from img/; groups are the file name and the tag's closing
+IMG_TAG_RE = re.compile(r'<img\b[^>]*?\bsrc="/img/([^"/]+)"[^>]*?(\s*/?>)')
+
+# Outputs that --precompress writes .gz and .br siblings for
+COMPRESSIBLE_EXTENSIONS = ['.html', '.xml', '.css', '.js', '.svg']
+COMPRESSED_SUFFIXES = ['.gz', '.br']
+
+# --watch waits this long after the last change before rebuilding
+WATCH_DEBOUNCE = 0.2
+WATCH_POLL_INTERVAL = 0.5
+
+# Rendered pages kept in memory by the preview server
+PREVIEW_PAGE_CACHE_SIZE = 128
+
+# Injected into HTML served by the preview server to reload on changes
+LIVE_RELOAD_PATH = '/__livereload'
+LIVE_RELOAD_SCRIPT = f"""<script>
+    new EventSource('{LIVE_RELOAD_PATH}').onmessage = function() {{ location.reload(); }};
+</script>
+"""
+# Shown by the preview server when a page fails to render, until the next change fixes it
+PREVIEW_ERROR_TEMPLATE = """<!DOCTYPE html>
+<html lang="en">
+<head>
+    <meta charset="UTF-8">
+    <title>Build error</title>
+</head>
+<body>
+    <h1>Build error</h1>
+    <pre>{error}</pre>
+    {live_reload}
+</body>
+</html>
+"""
+
+# Post list written once and loaded by every page in --shared-nav mode
+NAV_FILE = 'nav.html'
+ARCHIVE_DIR = 'archive'
+SHARED_NAV_HTML = f"""<div class="shared-nav" data-nav-src="/{NAV_FILE}"></div>
+            <noscript><a href="/{ARCHIVE_DIR}/">Archive</a></noscript>"""
+
+# Ends the sidebar when --sidebar-limit leaves posts out
+ARCHIVE_LINK_HTML = f"""<div class="archive-link">
+            <a href="/{ARCHIVE_DIR}/">Archive &rarr;</a>
+        </div>"""
+
+# Build manifest kept in the output directory for --incremental builds
+MANIFEST_FILE = '.credcast-manifest.json'
+# Maps each static asset's plain name to its content-hashed name, for deploy tooling
+ASSET_MANIFEST_FILE = 'assets.json'
+MANIFEST_VERSION = 1
+# RSS items of the posts in feed.xml, kept for --incremental builds without the render cache
+FEED_ITEMS_FILE = '.credcast-feed.json'
+# What each deploy target was last sent, kept in the output directory
+DEPLOY_STATE_FILE = '.credcast-deploy.json'
+DEPLOY_STATE_VERSION = 1
+
+# Bump when parse_markdown_file changes its output for the same input
+RENDER_CACHE_VERSION = 5
+DEFAULT_CACHE_SIZE_MB = 256
+
+# Code blocks are highlighted by Pygments at build time; in the browser by
+# highlight.js, or with --server-highlight by a Pygments stylesheet in this style
+PYGMENTS_STYLE = 'one-dark'
+HIGHLIGHT_JS_CSS = "https://cdnjs.cloudflare.com/ajax/libs/highlight.js/11.7.0/styles/atom-one-dark.min.css"
+HIGHLIGHT_JS_URL = "https://cdnjs.cloudflare.com/ajax/libs/highlight.js/11.7.0/highlight.min.js"
+MERMAID_URL = "https://cdn.jsdelivr.net/npm/mermaid/dist/mermaid.min.js"
+MATHJAX_URL = "https://cdnjs.cloudflare.com/ajax/libs/mathjax/2.7.7/MathJax.js?config=TeX-MML-AM_CHTML"
+
+# What parse_markdown_file records a post as using, which decides the scripts its page loads:
+# code blocks (highlight.js), diagrams (Mermaid), math left for MathJax and cred@ blocks
+POST_FEATURES = ('code', 'mermaid', 'math', 'cred')
+
 # Templates
 HTML_TEMPLATE = """<!DOCTYPE html>
 <html lang="en">
@@ -24,20 +192,9 @@ HTML_TEMPLATE = """<!DOCTYPE html>
     <meta charset="UTF-8">
     <meta name="viewport" content="width=device-width, initial-scale=1.0">
     <title>{title} | {site_name}</title>
-    <link rel="stylesheet" href="/style.css">
-    <link rel="stylesheet" href="https://cdnjs.cloudflare.com/ajax/libs/highlight.js/11.7.0/styles/atom-one-dark.min.css">
+    <link rel="stylesheet" href="{style_url}">
     <link rel="stylesheet" href="https://fonts.googleapis.com/css2?family=Anonymous+Pro:ital,wght@0,400;0,700;1,400;1,700&display=swap">
-    <script src="https://cdnjs.cloudflare.com/ajax/libs/highlight.js/11.7.0/highlight.min.js"></script>
-    <script src="https://cdn.jsdelivr.net/npm/mermaid/dist/mermaid.min.js"></script>
-    <script>
-        mermaid.initialize({{
-            theme: 'dark',
-            securityLevel: 'loose',
-            startOnLoad: true
-        }});
-    </script>
-    <script src="https://cdnjs.cloudflare.com/ajax/libs/mathjax/2.7.7/MathJax.js?config=TeX-MML-AM_CHTML"></script>
-    <script src="/scripts.js"></script>
+    {head}
 </head>
 <body class="blog-layout">
     <div class="nav-sidebar">
@@ -71,20 +228,9 @@ INDEX_TEMPLATE = """<!DOCTYPE html>
     <meta charset="UTF-8">
     <meta name="viewport" content="width=device-width, initial-scale=1.0">
     <title>{site_name}</title>
-    <link rel="stylesheet" href="/style.css">
-    <link rel="stylesheet" href="https://cdnjs.cloudflare.com/ajax/libs/highlight.js/11.7.0/styles/atom-one-dark.min.css">
+    <link rel="stylesheet" href="{style_url}">
     <link rel="stylesheet" href="https://fonts.googleapis.com/css2?family=Anonymous+Pro:ital,wght@0,400;0,700;1,400;1,700&display=swap">
-    <script src="https://cdnjs.cloudflare.com/ajax/libs/highlight.js/11.7.0/highlight.min.js"></script>
-    <script src="https://cdn.jsdelivr.net/npm/mermaid/dist/mermaid.min.js"></script>
-    <script>
-        mermaid.initialize({{
-            theme: 'dark',
-            securityLevel: 'loose',
-            startOnLoad: true
-        }});
-    </script>
-    <script src="https://cdnjs.cloudflare.com/ajax/libs/mathjax/2.7.7/MathJax.js?config=TeX-MML-AM_CHTML"></script>
-    <script src="/scripts.js"></script>
+    {head}
 </head>
 <body class="blog-layout">
     <div class="nav-sidebar">
@@ -125,22 +271,18 @@ RSS_ITEM_TEMPLATE = """
 </item>"""
 
 SCRIPTS_JS = """document.addEventListener('DOMContentLoaded', function() {
-    // Initialize highlight.js
-    hljs.highlightAll();
-    
-    // Initialize MathJax
-    if (typeof MathJax !== 'undefined') {
-        MathJax.Hub.Queue(["Typeset", MathJax.Hub]);
+    // Initialize highlight.js, which pages built with --server-highlight do not load
+    if (typeof hljs !== 'undefined') {
+        hljs.highlightAll();
     }
     
-    # Initialize Mermaid diagrams
+    // Initialize Mermaid diagrams, which are only loaded by pages that have them
     if (typeof mermaid !== 'undefined') {
-        console.log("Initializing mermaid diagrams");
         try {
             mermaid.initialize({
                 theme: 'dark',
                 securityLevel: 'loose',
-                startOnLoad: true
+                startOnLoad: false
             });
             mermaid.init(undefined, '.mermaid');
         } catch (err) {
@@ -155,6 +297,24 @@ SCRIPTS_JS = """document.addEventListener('DOMContentLoaded', function() {
         html = html.replace(/(@cred@[a-zA-Z0-9:._-]+)/g, '<span class="cred-highlight">$1</span>');
         block.innerHTML = html;
     });
+});
+
+// Load the shared post list into pages built with --shared-nav
+document.addEventListener('DOMContentLoaded', function() {
+    var nav = document.querySelector('[data-nav-src]');
+    if (!nav) {
+        return;
+    }
+    fetch(nav.getAttribute('data-nav-src')).then(function(response) {
+        return response.text();
+    }).then(function(html) {
+        nav.innerHTML = html;
+        nav.querySelectorAll('.post-link a').forEach(function(link) {
+            if (link.getAttribute('href') === window.location.pathname) {
+                link.parentNode.classList.add('current');
+            }
+        });
+    });
 });"""
 
 STYLE_CSS = """:root {
@@ -262,6 +422,18 @@ body {
     word-wrap: break-word;
 }
 
+.archive-link a {
+    display: block;
+    padding: 5px 0;
+}
+
+/* Newer/older links on paginated listings */
+.pager {
+    display: flex;
+    justify-content: space-between;
+    margin-top: 2em;
+}
+
 /* Links */
 a {
     color: var(--link-color);
@@ -433,15 +605,51 @@ pre code.language-cred {
     stroke-width: 1 !important;
 }"""
 
-def parse_frontmatter(content):
-    """Extract YAML front matter from markdown content"""
+# Colors for the spans Pygments puts in code blocks, used by --server-highlight
+PYGMENTS_CSS = HtmlFormatter(style=PYGMENTS_STYLE).get_style_defs('.highlight')
+
+# Static assets by their plain name; each is written under a content-hashed name
+STATIC_ASSETS = {
+    'style.css': STYLE_CSS,
+    'scripts.js': SCRIPTS_JS,
+    'pygments.css': PYGMENTS_CSS
+}
+
+def split_frontmatter(content):
+    """Split markdown content into its raw YAML front matter (None if absent) and body"""
     if content.startswith('---'):
         end_idx = content.find('---', 3)
         if end_idx != -1:
-            front_matter = yaml.safe_load(content[3:end_idx])
-            content = content[end_idx+3:].strip()
-            return front_matter, content
-    return {}, content
+            return content[3:end_idx], content[end_idx+3:].strip()
+    return None, content
+
+def parse_frontmatter(content):
+    """Extract YAML front matter from markdown content"""
+    raw_front_matter, content = split_frontmatter(content)
+    if raw_front_matter is None:
+        return {}, content
+    return yaml.load(raw_front_matter, Loader=YAML_LOADER) or {}, content
+
+def read_frontmatter(file_path):
+    """Read only the leading front matter of a markdown file, or None if it has none"""
+    with open(file_path, 'r', encoding='utf-8') as f:
+        head = f.read(FRONT_MATTER_READ_SIZE)
+        if not head.startswith('---'):
+            return None
+        
+        # Keep reading in bounded chunks until the closing marker shows up
+        while head.find('---', 3) == -1:
+            chunk = f.read(FRONT_MATTER_READ_SIZE)
+            if not chunk:
+                return None
+            head += chunk
+    
+    raw_front_matter, _ = split_frontmatter(head)
+    return yaml.load(raw_front_matter, Loader=YAML_LOADER) or {}
+
+def is_published(front_matter):
+    """Return True if a post with this front matter (None = no front matter) should be built"""
+    return front_matter is not None and not front_matter.get('draft', False)
 
 def format_date(date_value):
     """Format date for display"""
@@ -471,30 +679,434 @@ def format_rfc822_date(date_value):
     else:
         return datetime.now().strftime('%a, %d %b %Y %H:%M:%S +0000')
 
-def parse_markdown_file(file_path):
-    """Parse a markdown file and extract metadata and content"""
-    with open(file_path, 'r', encoding='utf-8') as f:
-        content = f.read()
+class MarkdownRenderer:
+    """Reusable Markdown converter, built once per thread and reset between documents"""
     
-    # Parse front matter
-    front_matter, markdown_content = parse_frontmatter(content)
+    def __init__(self, extensions=MARKDOWN_EXTENSIONS, extension_configs=MARKDOWN_EXTENSION_CONFIGS,
+                 unlabeled_code='guess'):
+        self.extensions = extensions
+        self.extension_configs = extension_configs
+        # How code blocks without a language are highlighted, see set_unlabeled_code()
+        self.unlabeled_code = unlabeled_code
+        self.local = threading.local()
     
-    # Extract metadata with defaults
-    title = front_matter.get('title', os.path.splitext(os.path.basename(file_path))[0])
+    def get_markdown(self):
+        """Return this thread's configured markdown.Markdown instance"""
+        md = getattr(self.local, 'md', None)
+        if md is None:
+            md = markdown.Markdown(
+                extensions=markdown_extensions(self.extensions, self.extension_configs),
+                extension_configs=self.extension_configs
+            )
+            self.local.md = md
+        return md
+    
+    def render(self, text):
+        """Convert Markdown text to HTML"""
+        # reset() clears per-document state such as footnotes, abbreviations and the toc
+        return self.get_markdown().reset().convert(text)
+
+# Shared renderer; each process (including --jobs workers) gets its own copy
+markdown_renderer = MarkdownRenderer()
+
+UNLABELED_CODE_POLICIES = ('guess', 'plain')
+
+def is_known_lexer(name):
+    """Return whether Pygments has a lexer for a language name, without importing it"""
+    global known_lexers
+    if known_lexers is None:
+        # Built only once a block is highlighted, as listing plugin lexers is slow
+        known_lexers = frozenset(alias for _, aliases, _, _ in get_all_lexers() for alias in aliases)
+    return name.lower() in known_lexers
+
+known_lexers = None
+
+def unlabeled_code_policy(value):
+    """Check an --unlabeled-code value: guess, plain or a Pygments language name"""
+    if value in UNLABELED_CODE_POLICIES:
+        return value
+    try:
+        get_lexer_by_name(value)
+    except ClassNotFound:
+        raise argparse.ArgumentTypeError(f"expected guess, plain or a Pygments language, got '{value}'")
+    return value
+
+def set_unlabeled_code(policy):
+    """Set how this process highlights code blocks without a language tag
+    
+    'guess' runs Pygments' guess_lexer, which tries every lexer on the code;
+    'plain' leaves them as plain text; anything else is the language to use.
+    Also the initializer of render pools, whose workers start without the
+    parent's settings.
+    """
+    markdown_renderer.unlabeled_code = policy
+
+class HighlightStats:
+    """Counts of code blocks served from the highlight cache and highlighted by Pygments in this process"""
+    
+    def __init__(self):
+        self.hits = 0
+        self.misses = 0
+        # Lexer name -> [blocks, seconds, slowest block seconds, source of the slowest block]
+        self.lexers = {}
+    
+    def record(self, lexer, seconds, source):
+        """Count one block highlighted by Pygments with the given lexer"""
+        entry = self.lexers.setdefault(lexer, [0, 0.0, 0.0, None])
+        entry[0] += 1
+        entry[1] += seconds
+        if seconds >= entry[2]:
+            entry[2] = seconds
+            entry[3] = source
+    
+    def take(self):
+        """Return the counts and start counting from zero, to hand a worker's counts to the parent"""
+        counts = {'hits': self.hits, 'misses': self.misses, 'lexers': self.lexers}
+        self.__init__()
+        return counts
+    
+    def add(self, counts):
+        """Add counts returned by take() in another process"""
+        self.hits += counts['hits']
+        self.misses += counts['misses']
+        for lexer, (blocks, seconds, slowest, source) in counts['lexers'].items():
+            entry = self.lexers.setdefault(lexer, [0, 0.0, 0.0, None])
+            entry[0] += blocks
+            entry[1] += seconds
+            if slowest >= entry[2]:
+                entry[2] = slowest
+                entry[3] = source
+    
+    def report(self):
+        """Print where highlighting time went, slowest lexer first"""
+        for lexer, (blocks, seconds, slowest, source) in sorted(
+                self.lexers.items(), key=lambda item: item[1][1], reverse=True):
+            print(f"  {lexer}: {blocks} blocks, {seconds * 1000:.1f} ms"
+                  f" (slowest {slowest * 1000:.1f} ms in {source})")
+
+highlight_stats = HighlightStats()
+
+# The render cache and source file of the post being rendered on this thread, for CachedCodeHilite
+highlight_context = threading.local()
+
+class CachedCodeHilite(codehilite.CodeHilite):
+    """CodeHilite that keeps highlighted code blocks in the render cache
+    
+    Blocks are keyed by their language, code and formatter options, so
+    editing the prose or front matter of a post does not lex its code again.
+    Blocks without a language follow markdown_renderer.unlabeled_code.
+    """
+    
+    def hilite(self, shebang=True):
+        # Read a "#!lang" or ":::lang" first line now, so only blocks that
+        # are really unlabeled get the unlabeled code policy
+        self.src = self.src.strip('\n')
+        if self.lang is None and shebang:
+            self._parseHeader()
+        
+        policy = markdown_renderer.unlabeled_code
+        if policy != 'guess':
+            # Unknown language names fall back to plain text instead of a guess too
+            self.guess_lang = False
+            if self.lang is None and policy != 'plain':
+                self.lang = policy
+        
+        cache = getattr(highlight_context, 'cache', None)
+        key = None
+        if cache is not None and self.use_pygments:
+            key = cache.highlight_key(json.dumps([
+                self.src, self.lang, self.guess_lang, self.lang_prefix,
+                str(self.pygments_formatter), self.options
+            ], sort_keys=True, default=str))
+            html = cache.get_highlight(key)
+            if html is not None:
+                highlight_stats.hits += 1
+                return html
+        
+        # What the lexer is reported as in the highlighting stats
+        label = self.lang
+        if label is not None and not is_known_lexer(label):
+            label = f"{label} ({'guessed' if self.guess_lang else 'text'})"
+        guessed = self.lang is None and self.guess_lang
+        
+        start = time.perf_counter()
+        html = super().hilite(shebang=False)
+        if self.use_pygments:
+            # Pygments sets self.lang to the lexer it picked for unlabeled blocks
+            label = f"{self.lang} (guessed)" if guessed else label or self.lang
+            highlight_stats.record(label, time.perf_counter() - start, getattr(highlight_context, 'source', None))
+        highlight_stats.misses += 1
+        if key is not None:
+            cache.put_highlight(key, html)
+        return html
+
+class CachedHiliteTreeprocessor(codehilite.HiliteTreeprocessor):
+    """Highlights indented code blocks with CachedCodeHilite"""
     
-    # Handle date - try to parse it if string, use as is if datetime
-    date_value = front_matter.get('date')
+    def run(self, root):
+        for block in root.iter('pre'):
+            if len(block) != 1 or block[0].tag != 'code' or block[0].text is None:
+                continue
+            local_config = self.config.copy()
+            code = CachedCodeHilite(
+                self.code_unescape(block[0].text),
+                tab_length=self.md.tab_length,
+                style=local_config.pop('pygments_style', 'default'),
+                **local_config
+            )
+            placeholder = self.md.htmlStash.store(code.hilite())
+            # Replaced by the stashed HTML like any other raw HTML paragraph
+            block.clear()
+            block.tag = 'p'
+            block.text = placeholder
+
+class CachedCodeHiliteExtension(codehilite.CodeHiliteExtension):
+    """codehilite, highlighting with CachedCodeHilite"""
+    
+    def extendMarkdown(self, md):
+        hiliter = CachedHiliteTreeprocessor(md)
+        hiliter.config = self.getConfigs()
+        md.treeprocessors.register(hiliter, 'hilite', 30)
+        md.registerExtension(self)
+
+class CachedFencedBlockPreprocessor(fenced_code.FencedBlockPreprocessor):
+    """Fenced code blocks, highlighted with CachedCodeHilite
+    
+    The same as the stock preprocessor, except that blocks are highlighted
+    with CachedCodeHilite and the settings of the CachedCodeHiliteExtension.
+    """
+    
+    def run(self, lines):
+        if not self.checked_for_deps:
+            for ext in self.md.registeredExtensions:
+                if isinstance(ext, CachedCodeHiliteExtension):
+                    self.codehilite_conf = ext.getConfigs()
+                if isinstance(ext, AttrListExtension):
+                    self.use_attr_list = True
+            self.checked_for_deps = True
+        
+        text = "\n".join(lines)
+        index = 0
+        while True:
+            m = self.FENCED_BLOCK_RE.search(text, index)
+            if not m:
+                break
+            lang, id, classes, config = None, '', [], {}
+            if m.group('attrs'):
+                attrs, remainder = get_attrs_and_remainder(m.group('attrs'))
+                if remainder:
+                    # Unbalanced braces, not a fenced block
+                    index = m.end('attrs')
+                    continue
+                id, classes, config = self.handle_attrs(attrs)
+                if classes:
+                    lang = classes.pop(0)
+            else:
+                lang = m.group('lang') or None
+                if m.group('hl_lines'):
+                    config['hl_lines'] = fenced_code.parse_hl_lines(m.group('hl_lines'))
+            
+            if self.codehilite_conf and self.codehilite_conf['use_pygments'] and config.get('use_pygments', True):
+                local_config = self.codehilite_conf.copy()
+                local_config.update(config)
+                if classes:
+                    # css_class last, Pygments may append a suffix to it
+                    local_config['css_class'] = f"{' '.join(classes)} {local_config['css_class']}"
+                highliter = CachedCodeHilite(
+                    m.group('code'),
+                    lang=lang,
+                    style=local_config.pop('pygments_style', 'default'),
+                    **local_config
+                )
+                code = highliter.hilite(shebang=False)
+            else:
+                id_attr = lang_attr = class_attr = kv_pairs = ''
+                if lang:
+                    prefix = self.config.get('lang_prefix', 'language-')
+                    lang_attr = f' class="{prefix}{escape_attrib_html(lang)}"'
+                if classes:
+                    class_attr = f' class="{escape_attrib_html(" ".join(classes))}"'
+                if id:
+                    id_attr = f' id="{escape_attrib_html(id)}"'
+                if self.use_attr_list and config and not config.get('use_pygments', False):
+                    kv_pairs = ''.join(f' {k}="{escape_attrib_html(v)}"' for k, v in config.items() if k != 'use_pygments')
+                code = f'<pre{id_attr}{class_attr}><code{lang_attr}{kv_pairs}>{self._escape(m.group("code"))}</code></pre>'
+            
+            placeholder = self.md.htmlStash.store(code)
+            text = f'{text[:m.start()]}\n{placeholder}\n{text[m.end():]}'
+            index = m.start() + 1 + len(placeholder)
+        return text.split("\n")
+
+class CachedFencedCodeExtension(fenced_code.FencedCodeExtension):
+    """fenced_code, highlighting with CachedCodeHilite when credcast.codehilite is enabled"""
+    
+    def extendMarkdown(self, md):
+        md.registerExtension(self)
+        md.preprocessors.register(CachedFencedBlockPreprocessor(md, self.getConfigs()), 'fenced_code_block', 25)
+
+# Extensions named in MARKDOWN_EXTENSIONS that are defined here
+CREDCAST_EXTENSIONS = {
+    'credcast.codehilite': CachedCodeHiliteExtension,
+    'credcast.fenced_code': CachedFencedCodeExtension
+}
+
+def markdown_extensions(extensions=MARKDOWN_EXTENSIONS, extension_configs=MARKDOWN_EXTENSION_CONFIGS):
+    """Return extensions for markdown.Markdown, with the credcast.* names made into instances"""
+    return [CREDCAST_EXTENSIONS[name](**extension_configs.get(name, {})) if name in CREDCAST_EXTENSIONS else name
+            for name in extensions]
+
+def parse_date(date_value, file_path):
+    """Normalize a front matter date to a datetime, parsed exactly once per post"""
+    if isinstance(date_value, datetime):
+        return date_value
+    if isinstance(date_value, date):
+        # YAML turns bare dates into date objects; use midnight so all posts sort together
+        return datetime(date_value.year, date_value.month, date_value.day)
     if date_value is None:
-        date_value = datetime.now()
-    elif isinstance(date_value, str):
-        try:
-            date_value = dateutil_parser.parse(date_value)
-        except ValueError:
-            print(f"Warning: Could not parse date '{date_value}' in {file_path}. Using current date.")
-            date_value = datetime.now()
+        return datetime.now()
     
+    date_str = str(date_value).strip()
+    # ISO 8601 fast path, dateutil only for free-form dates
+    try:
+        return datetime.fromisoformat(date_str)
+    except ValueError:
+        pass
+    try:
+        return dateutil_parser.parse(date_str)
+    except (ValueError, OverflowError):
+        print(f"Warning: Could not parse date '{date_value}' in {file_path}. Using current date.")
+        return datetime.now()
+
+class Post:
+    """A blog post with its date, URL and output path computed once"""
+    
+    __slots__ = (
+        'title', 'date', 'tags', 'source_path', 'content', 'features',
+        'url', 'output_path', 'date_display', 'date_iso', 'date_rfc822'
+    )
+    
+    def __init__(self, title, date_value, tags, source_path, content=None):
+        self.title = title
+        self.date = date_value
+        self.tags = tags
+        self.source_path = source_path
+        self.content = content
+        # Names from POST_FEATURES, filled in when the post is rendered
+        self.features = ()
+        
+        self.url = f"/{date_value.year}/{date_value.month:02d}/{date_value.day:02d}/"
+        # Relative to the output directory
+        self.output_path = os.path.join(
+            str(date_value.year),
+            f"{date_value.month:02d}",
+            f"{date_value.day:02d}",
+            'index.html'
+        )
+        self.date_display = format_date(date_value)
+        self.date_iso = date_value.strftime('%Y-%m-%d')
+        self.date_rfc822 = format_rfc822_date(date_value)
+    
+    def __repr__(self):
+        return f"Post({self.title!r}, {self.date_iso}, {self.source_path!r})"
+
+def post_metadata(front_matter, file_path):
+    """Build a post's metadata (everything but the content) from its front matter"""
+    # Extract metadata with defaults
+    title = front_matter.get('title', os.path.splitext(os.path.basename(file_path))[0])
+    date_value = parse_date(front_matter.get('date'), file_path)
     tags = front_matter.get('tags', [])
     
+    return Post(title, date_value, tags, file_path)
+
+def tex_to_mathml(tex, display):
+    """Convert TeX to MathML, or return None if the converter does not support it"""
+    try:
+        mathml = latex2mathml.converter.convert(tex.strip(), display=display)
+    except Exception:
+        # The converter raises many kinds of errors on TeX it cannot parse
+        return None
+    # Unknown commands are passed through as identifiers like <mi>\foo</mi>
+    if '\\' in mathml:
+        return None
+    return mathml
+
+def convert_math(markdown_content):
+    """Replace TeX math outside code with placeholders for its MathML
+    
+    Returns the new Markdown and {placeholder: (MathML, TeX)} for
+    restore_math. Math the converter cannot handle is left in the text for
+    MathJax.
+    """
+    if latex2mathml is None:
+        return markdown_content, {}
+    
+    stash = {}
+    
+    def stash_math(match):
+        display = match.group(1) is not None
+        mathml = tex_to_mathml(match.group(1) if display else match.group(2), 'block' if display else 'inline')
+        if mathml is None:
+            return match.group(0)
+        digits = ''.join(chr(0xe010 + int(digit)) for digit in str(len(stash)))
+        placeholder = f"\ue000{digits}\ue001"
+        stash[placeholder] = (mathml, match.group(0))
+        return placeholder
+    
+    parts = []
+    last = 0
+    for code in MARKDOWN_CODE_RE.finditer(markdown_content):
+        parts.append(MATH_RE.sub(stash_math, markdown_content[last:code.start()]))
+        parts.append(code.group(0))
+        last = code.end()
+    parts.append(MATH_RE.sub(stash_math, markdown_content[last:]))
+    return ''.join(parts), stash
+
+def restore_math(html, stash):
+    """Put the MathML stashed by convert_math in place of its placeholders
+    
+    Placeholders inside a tag, such as a link title, get the TeX source back
+    instead, as MathML cannot go in an attribute.
+    """
+    if not stash:
+        return html
+    
+    # Display math on its own line was wrapped in a paragraph
+    html = re.sub(f"<p>({MATH_PLACEHOLDER_RE.pattern})</p>", lambda m: stash[m.group(1)][0], html)
+    
+    def restore_text(text):
+        return MATH_PLACEHOLDER_RE.sub(lambda m: stash[m.group(0)][0], text)
+    
+    def restore_tag(tag):
+        return MATH_PLACEHOLDER_RE.sub(lambda m: html_lib.escape(stash[m.group(0)][1]), tag)
+    
+    parts = []
+    last = 0
+    for tag in HTML_TAG_RE.finditer(html):
+        parts.append(restore_text(html[last:tag.start()]))
+        parts.append(restore_tag(tag.group(0)))
+        last = tag.end()
+    parts.append(restore_text(html[last:]))
+    return ''.join(parts)
+
+def has_unconverted_math(html):
+    """Return True if html outside code still has TeX for MathJax to typeset"""
+    # MathJax only typesets text, not attributes such as a link title
+    text = HTML_TAG_RE.sub(' ', HTML_CODE_RE.sub('', html))
+    return MATH_RE.search(text) is not None or '\\begin{' in text
+
+def parse_markdown_file(file_path, cache=None):
+    """Parse a markdown file and extract metadata and content
+    
+    With a cache, code blocks are highlighted through its highlight store.
+    """
+    with open(file_path, 'r', encoding='utf-8') as f:
+        content = f.read()
+    
+    # Parse front matter
+    front_matter, markdown_content = parse_frontmatter(content)
+    post = post_metadata(front_matter, file_path)
+    title = post.title
+    
     # Remove title manually from markdown content
     # This handles different ways the title might appear
     lines = markdown_content.strip().split('\n')
@@ -514,87 +1126,579 @@ def parse_markdown_file(file_path):
     # Use the sanitized content
     markdown_content = '\n'.join(sanitized_lines)
     
+    # Math becomes MathML at build time, before Markdown can mangle the TeX
+    markdown_content, math_stash = convert_math(markdown_content)
+    
     # Convert to HTML
     # Special handling for mermaid code blocks
-    markdown_content = re.sub(
+    markdown_content, diagrams = re.subn(
         r'```mermaid\s*([\s\S]*?)```',
         r'<div class="mermaid">\1</div>',
         markdown_content
     )
+    has_cred_blocks = re.search(r'^```cred\b', markdown_content, re.M) is not None
     
     # Convert remaining markdown to HTML
-    html_content = markdown.markdown(
-        markdown_content,
-        extensions=[
-            'markdown.extensions.extra',
-            'markdown.extensions.smarty',
-            'markdown.extensions.toc',
-            CodeHiliteExtension(css_class='highlight'),
-            FencedCodeExtension()
-        ]
-    )
+    highlight_context.cache = cache
+    highlight_context.source = file_path
+    try:
+        html_content = markdown_renderer.render(markdown_content)
+    finally:
+        highlight_context.cache = None
+        highlight_context.source = None
     
-    # Format date strings
-    date_display = format_date(date_value)
-    date_iso = date_value.strftime('%Y-%m-%d')
+    post.content = restore_math(html_content, math_stash)
     
-    return {
-        'title': title,
-        'date': date_value,
-        'date_display': date_display,
-        'date_iso': date_iso,
-        'tags': tags,
-        'content': html_content,
-        'source_path': file_path
+    # Record what the page needs scripts for
+    used = {
+        'code': '<pre' in post.content,
+        'mermaid': diagrams > 0,
+        'math': has_unconverted_math(post.content),
+        'cred': has_cred_blocks
     }
+    post.features = tuple(name for name in POST_FEATURES if used[name])
+    return post
 
-def process_markdown_files(content_dir):
-    """Process all markdown files in a directory and its subdirectories"""
-    posts = []
+def latex2mathml_version():
+    """Return the installed latex2mathml version, or None if math is left for MathJax"""
+    if latex2mathml is None:
+        return None
+    return getattr(latex2mathml, '__version__', 'unknown')
+
+def parse_markdown_file_worker(file_path, cache=None):
+    """Parse a markdown file in a worker process, returning (post, highlight counts)"""
+    post = parse_markdown_file(file_path, cache)
+    return post, highlight_stats.take()
+
+def default_cache_dir():
+    """Return the default render cache directory"""
+    base = os.environ.get('XDG_CACHE_HOME') or os.path.join(os.path.expanduser('~'), '.cache')
+    return os.path.join(base, 'credcast')
+
+class RenderCache:
+    """On-disk cache of parsed posts, keyed by source bytes and renderer configuration"""
+    
+    def __init__(self, cache_dir, max_bytes=DEFAULT_CACHE_SIZE_MB * 1024 * 1024):
+        self.cache_dir = cache_dir
+        self.entries_dir = os.path.join(cache_dir, 'render')
+        self.fragments_dir = os.path.join(cache_dir, 'fragments')
+        self.images_dir = os.path.join(cache_dir, 'images')
+        self.highlight_dir = os.path.join(cache_dir, 'highlight')
+        self.stats_path = os.path.join(cache_dir, 'stats.json')
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self.fragment_hits = 0
+        self.fragment_misses = 0
+        self.image_hits = 0
+        self.image_misses = 0
+        
+        # Everything besides the file itself that affects the rendered output
+        config = json.dumps({
+            'version': RENDER_CACHE_VERSION,
+            'markdown': markdown.__version__,
+            'pygments': pygments.__version__,
+            'latex2mathml': latex2mathml_version(),
+            'extensions': MARKDOWN_EXTENSIONS,
+            'extension_configs': MARKDOWN_EXTENSION_CONFIGS,
+            'unlabeled_code': markdown_renderer.unlabeled_code
+        }, sort_keys=True)
+        self.config_digest = hashlib.sha256(config.encode('utf-8')).hexdigest()
+    
+    def key(self, file_path, data):
+        """Return the cache key for a source file with the given bytes"""
+        h = hashlib.sha256(self.config_digest.encode('ascii'))
+        # The file name is the fallback title, so it is part of the output too
+        h.update(os.path.basename(file_path).encode('utf-8'))
+        h.update(b'\0')
+        h.update(data)
+        return h.hexdigest()
+    
+    def file_key(self, file_path):
+        """Return the cache key for a markdown file's current contents"""
+        with open(file_path, 'rb') as f:
+            return self.key(file_path, f.read())
+    
+    def lookup(self, file_path):
+        """Return (key, cached post or None) for a markdown file"""
+        key = self.file_key(file_path)
+        post = self.get(key)
+        if post is not None:
+            post.source_path = file_path
+        return key, post
+    
+    def entry_path(self, key):
+        """Return the path of the cache entry for key"""
+        return os.path.join(self.entries_dir, key[:2], key + '.pickle')
+    
+    def get(self, key):
+        """Return the cached post for key, or None on a miss"""
+        path = self.entry_path(key)
+        try:
+            with open(path, 'rb') as f:
+                post = pickle.load(f)
+        except (OSError, pickle.UnpicklingError, EOFError, AttributeError):
+            self.misses += 1
+            return None
+        
+        # Bump the mtime so eviction drops the least recently used entries first
+        try:
+            os.utime(path)
+        except OSError:
+            pass
+        self.hits += 1
+        return post
+    
+    def put(self, key, post):
+        """Store a parsed post under key"""
+        path = self.entry_path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        with open(tmp_path, 'wb') as f:
+            pickle.dump(post, f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp_path, path)
+    
+    def fragment_path(self, key):
+        """Return the path of the cached fragment for key"""
+        return os.path.join(self.fragments_dir, key[:2], key + '.html')
+    
+    def get_fragment(self, key):
+        """Return a cached generated fragment (e.g. an RSS item), or None on a miss"""
+        path = self.fragment_path(key)
+        try:
+            with open(path, 'r', encoding='utf-8') as f:
+                fragment = f.read()
+        except OSError:
+            self.fragment_misses += 1
+            return None
+        
+        try:
+            os.utime(path)
+        except OSError:
+            pass
+        self.fragment_hits += 1
+        return fragment
+    
+    def put_fragment(self, key, fragment):
+        """Store a generated fragment under key"""
+        path = self.fragment_path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            f.write(fragment)
+        os.replace(tmp_path, path)
+    
+    def highlight_key(self, block):
+        """Return the cache key for a code block described by block"""
+        h = hashlib.sha256(pygments.__version__.encode('ascii'))
+        h.update(b'\0')
+        h.update(block.encode('utf-8'))
+        return h.hexdigest()
+    
+    def highlight_path(self, key):
+        """Return the path of the cached highlighted code block for key"""
+        return os.path.join(self.highlight_dir, key[:2], key + '.html')
+    
+    def get_highlight(self, key):
+        """Return a cached highlighted code block, or None on a miss"""
+        path = self.highlight_path(key)
+        try:
+            with open(path, 'r', encoding='utf-8') as f:
+                html = f.read()
+        except OSError:
+            return None
+        
+        try:
+            os.utime(path)
+        except OSError:
+            pass
+        return html
+    
+    def put_highlight(self, key, html):
+        """Store a highlighted code block under key"""
+        path = self.highlight_path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            f.write(html)
+        os.replace(tmp_path, path)
     
+    def image_path(self, key, ext):
+        """Return the path of the cached image variant for key"""
+        return os.path.join(self.images_dir, key[:2], f"{key}.{ext}")
+    
+    def entries(self):
+        """Return (path, size, mtime) for every cached post, fragment, code block and image variant"""
+        entries = []
+        for top, suffix in ((self.entries_dir, '.pickle'), (self.fragments_dir, '.html'),
+                            (self.highlight_dir, '.html'), (self.images_dir, ('.webp', '.jpg'))):
+            if not os.path.isdir(top):
+                continue
+            for shard in os.scandir(top):
+                if not shard.is_dir():
+                    continue
+                for entry in os.scandir(shard.path):
+                    if entry.name.endswith(suffix):
+                        st = entry.stat()
+                        entries.append((entry.path, st.st_size, st.st_mtime))
+        return entries
+    
+    def gc(self):
+        """Evict least recently used entries until the cache fits in max_bytes"""
+        entries = self.entries()
+        total = sum(size for _, size, _ in entries)
+        removed = 0
+        freed = 0
+        
+        entries.sort(key=lambda e: e[2])
+        for path, size, _ in entries:
+            if total <= self.max_bytes:
+                break
+            try:
+                os.remove(path)
+            except OSError:
+                continue
+            total -= size
+            freed += size
+            removed += 1
+        
+        return removed, freed
+    
+    def clear(self):
+        """Remove all cache entries and statistics"""
+        for top in (self.entries_dir, self.fragments_dir, self.highlight_dir, self.images_dir):
+            if os.path.isdir(top):
+                shutil.rmtree(top)
+        if os.path.exists(self.stats_path):
+            os.remove(self.stats_path)
+    
+    def load_stats(self):
+        """Return the persisted hit/miss statistics"""
+        try:
+            with open(self.stats_path, 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {'total_hits': 0, 'total_misses': 0}
+    
+    def save_stats(self):
+        """Add this build's hits and misses to the persisted statistics"""
+        stats = self.load_stats()
+        stats['total_hits'] = stats.get('total_hits', 0) + self.hits
+        stats['total_misses'] = stats.get('total_misses', 0) + self.misses
+        stats['last_hits'] = self.hits
+        stats['last_misses'] = self.misses
+        stats['last_build'] = time.time()
+        
+        os.makedirs(self.cache_dir, exist_ok=True)
+        tmp_path = f"{self.stats_path}.{os.getpid()}.tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(stats, f)
+        os.replace(tmp_path, self.stats_path)
+
+def find_markdown_files(content_dir):
+    """Return the paths of all markdown files under content_dir in a stable order"""
+    paths = []
     for root, _, files in os.walk(content_dir):
         for file in files:
             if file.endswith('.md'):
-                file_path = os.path.join(root, file)
-                post = parse_markdown_file(file_path)
-                posts.append(post)
+                paths.append(os.path.join(root, file))
+    
+    # os.walk order depends on the filesystem, so sort for reproducible builds
+    paths.sort()
+    return paths
+
+def get_pool_context():
+    """Return a multiprocessing context whose workers start with the render modules imported"""
+    if 'forkserver' not in multiprocessing.get_all_start_methods():
+        return multiprocessing.get_context()
+    
+    ctx = multiprocessing.get_context('forkserver')
+    # Workers are forked from a server that has already imported these,
+    # so each worker skips the markdown/pygments/yaml import cost
+    ctx.set_forkserver_preload(RENDER_PRELOAD_MODULES)
+    return ctx
+
+def render_pool(jobs):
+    """Return a process pool for rendering posts with this process's renderer settings"""
+    return ProcessPoolExecutor(max_workers=jobs, mp_context=get_pool_context(),
+                               initializer=set_unlabeled_code, initargs=(markdown_renderer.unlabeled_code,))
+
+def find_published_files(content_dir):
+    """Return (path, front matter) for every markdown file that should be published"""
+    published = []
+    for file_path in find_markdown_files(content_dir):
+        front_matter = read_frontmatter(file_path)
+        if is_published(front_matter):
+            published.append((file_path, front_matter))
+        else:
+            print(f"Skipping draft: {file_path}")
+    return published
+
+def scan_posts(content_dir):
+    """Collect metadata for all published posts without rendering any Markdown"""
+    posts = [post_metadata(front_matter, file_path)
+             for file_path, front_matter in find_published_files(content_dir)]
     
     # Sort posts by date (newest first)
-    posts.sort(key=lambda x: x['date'], reverse=True)
+    posts.sort(key=lambda x: x.date, reverse=True)
     return posts
 
-def generate_post_links(posts, current_post=None):
-    """Generate HTML for the post links sidebar"""
-    links = []
-    for post in posts:
-        # Handle date that might be a string or datetime object
-        date_value = post['date']
-        if isinstance(date_value, str):
-            try:
-                date_obj = dateutil_parser.parse(date_value)
-            except ValueError:
-                date_obj = datetime.now()
-        else:
-            # Already a datetime or date object
-            date_obj = date_value
-        
-        url = f"/{date_obj.year}/{date_obj.month:02d}/{date_obj.day:02d}/"
+def resolve_jobs(jobs):
+    """Return the number of worker processes to use for a --jobs value"""
+    if jobs is None:
+        return 1
+    if jobs <= 0:
+        return os.cpu_count() or 1
+    return jobs
+
+def render_post(file_path, cache=None):
+    """Parse a markdown file, served from the render cache when unchanged"""
+    if cache is None:
+        return parse_markdown_file(file_path)
+    
+    key, post = cache.lookup(file_path)
+    if post is None:
+        post = parse_markdown_file(file_path, cache)
+        cache.put(key, post)
+    return post
+
+def with_metadata(post, rendered):
+    """Return the body of rendered with the metadata of post, as scanned for this build
+    
+    A post without a date gets the current time whenever it is parsed, so a
+    rendered copy from the render cache can carry another date, URL and
+    output path than the scanned post the sidebar, index and feed link to.
+    """
+    merged = Post(post.title, post.date, post.tags, post.source_path, rendered.content)
+    merged.features = rendered.features
+    return merged
+
+def render_scanned_post(post, cache=None):
+    """Render a post found by the metadata scan, keeping its scanned metadata"""
+    return with_metadata(post, render_post(post.source_path, cache))
+
+def iter_rendered_posts(paths, jobs=1, cache=None):
+    """Yield rendered posts in the order of paths, holding only a small window in memory"""
+    jobs = resolve_jobs(jobs)
+    if jobs <= 1:
+        for file_path in paths:
+            yield render_post(file_path, cache)
+        return
+    
+    with render_pool(jobs) as pool:
+        # Each entry is (cache key, cached post or pending future)
+        window = deque()
         
-        # Highlight current post
-        current_class = ' current' if current_post and current_post['title'] == post['title'] else ''
+        def finish(entry):
+            key, pending = entry
+            if isinstance(pending, Post):
+                return pending
+            post, counts = pending.result()
+            highlight_stats.add(counts)
+            if cache is not None:
+                cache.put(key, post)
+            return post
         
-        # Format date display
-        date_display = format_date(date_value)
+        for file_path in paths:
+            key, post = cache.lookup(file_path) if cache is not None else (None, None)
+            window.append((key, post if post is not None else pool.submit(parse_markdown_file_worker, file_path, cache)))
+            # Keep every worker busy without queueing the whole corpus
+            if len(window) >= jobs * 2:
+                yield finish(window.popleft())
         
-        link_html = f"""<div class="post-link{current_class}">
-            <a href="{url}">
-                <span class="date">{date_display}</span>
-                <span class="title">{post['title']}</span>
+        while window:
+            yield finish(window.popleft())
+
+def process_markdown_files(content_dir, jobs=1, cache=None):
+    """Process all markdown files in a directory and its subdirectories"""
+    # Drafts are dropped by the front matter scan and never reach the renderer
+    paths = [file_path for file_path, _ in find_published_files(content_dir)]
+    posts = []
+    
+    # Serve unchanged posts from the render cache, only render the rest
+    to_render = []
+    keys = {}
+    for file_path in paths:
+        if cache is None:
+            to_render.append(file_path)
+            continue
+        key, post = cache.lookup(file_path)
+        if post is None:
+            keys[file_path] = key
+            to_render.append(file_path)
+        else:
+            posts.append(post)
+    
+    jobs = resolve_jobs(jobs)
+    if jobs > 1 and len(to_render) > 1:
+        # Render posts across a pool of worker processes
+        chunksize = max(1, len(to_render) // (jobs * 4))
+        with render_pool(jobs) as pool:
+            results = list(pool.map(parse_markdown_file_worker, to_render, [cache] * len(to_render),
+                                    chunksize=chunksize))
+        rendered = []
+        for post, counts in results:
+            highlight_stats.add(counts)
+            rendered.append(post)
+    else:
+        rendered = [parse_markdown_file(file_path, cache) for file_path in to_render]
+    
+    for post in rendered:
+        if cache is not None:
+            cache.put(keys[post.source_path], post)
+        posts.append(post)
+    
+    # Sort posts by date (newest first)
+    posts.sort(key=lambda x: x.date, reverse=True)
+    return posts
+
+class BuildOptions:
+    """Settings that change the generated pages, shared by every build mode"""
+    
+    __slots__ = ('shared_nav', 'page_size', 'sidebar_limit', 'feed_limit', 'feed_summary',
+                 'image_widths', 'image_format', 'server_highlight')
+    
+    def __init__(self, shared_nav=False, page_size=0, sidebar_limit=0, feed_limit=0, feed_summary=False,
+                 image_widths=(), image_format='webp', server_highlight=False):
+        self.shared_nav = shared_nav
+        # Posts per listing page, 0 disables the paginated listings
+        self.page_size = page_size
+        # Most recent posts shown in the sidebar, 0 shows all of them
+        self.sidebar_limit = sidebar_limit
+        # Most recent posts in feed.xml, 0 includes all of them
+        self.feed_limit = feed_limit
+        # Only put the first paragraph of each post in the feed
+        self.feed_summary = feed_summary
+        # Widths of the resized image variants, empty disables them
+        self.image_widths = tuple(image_widths)
+        self.image_format = image_format
+        # Style code blocks with PYGMENTS_CSS instead of loading highlight.js
+        self.server_highlight = server_highlight
+    
+    @classmethod
+    def from_args(cls, args):
+        """Build options from parsed command line arguments"""
+        return cls(
+            shared_nav=args.shared_nav,
+            page_size=args.page_size,
+            sidebar_limit=args.sidebar_limit,
+            feed_limit=args.feed_limit,
+            feed_summary=args.feed_summary,
+            image_widths=parse_image_widths(args.image_widths) if args.responsive_images else (),
+            image_format=args.image_format,
+            server_highlight=args.server_highlight
+        )
+    
+    def fingerprint(self):
+        """Return a stable string describing these options, for the build manifest"""
+        return json.dumps({name: getattr(self, name) for name in self.__slots__}, sort_keys=True)
+
+def parse_image_widths(value):
+    """Parse a comma separated --image-widths value into sorted widths"""
+    return tuple(sorted({int(width) for width in value.split(',') if width.strip()}))
+
+def hashed_asset_name(name, content):
+    """Return name with a hash of content before the extension, e.g. style.3f9a1c0b2d.css"""
+    stem, ext = os.path.splitext(name)
+    return f"{stem}.{hashlib.sha256(content.encode('utf-8')).hexdigest()[:10]}{ext}"
+
+# Content-hashed file names of the static assets, which never change for a given name
+ASSET_NAMES = {name: hashed_asset_name(name, content) for name, content in STATIC_ASSETS.items()}
+
+def asset_url(name):
+    """Return the URL of a static asset by its plain name"""
+    return '/' + ASSET_NAMES[name]
+
+def page_assets(options=None, post=None):
+    """Return the asset placeholders of HTML_TEMPLATE and INDEX_TEMPLATE for a page showing post
+    
+    Third-party scripts are only included for the features post uses, and
+    every script is deferred so none of them blocks rendering.
+    """
+    features = post.features if post is not None else ()
+    head = []
+    if 'code' in features:
+        if options is not None and options.server_highlight:
+            head.append(f'<link rel="stylesheet" href="{asset_url("pygments.css")}">')
+        else:
+            head.append(f'<link rel="stylesheet" href="{HIGHLIGHT_JS_CSS}">')
+            head.append(f'<script defer src="{HIGHLIGHT_JS_URL}"></script>')
+    if 'mermaid' in features:
+        head.append(f'<script defer src="{MERMAID_URL}"></script>')
+    if 'math' in features:
+        head.append(f'<script defer src="{MATHJAX_URL}"></script>')
+    head.append(f'<script defer src="{asset_url("scripts.js")}"></script>')
+    
+    return {
+        'style_url': asset_url('style.css'),
+        'head': '\n    '.join(head)
+    }
+
+def generate_post_link(post):
+    """Generate the sidebar link HTML for a single post"""
+    return f"""<div class="post-link">
+            <a href="{post.url}">
+                <span class="date">{post.date_display}</span>
+                <span class="title">{post.title}</span>
             </a>
         </div>"""
-        links.append(link_html)
+
+class PostLinks:
+    """The post links sidebar, generated once per build and shared by every page
+    
+    With a limit only the most recent posts are listed, followed by a link
+    to the archive.
+    """
+    
+    # The current post is marked by inserting ' current' right after this
+    CLASS_PREFIX = '<div class="post-link'
     
-    return '\n'.join(links)
+    def __init__(self, posts, limit=0):
+        links = []
+        self.offsets = {}
+        offset = 0
+        for post in posts[:limit] if limit else posts:
+            if links:
+                offset += 1  # '\n' separator
+            self.offsets[post.source_path] = offset + len(self.CLASS_PREFIX)
+            link_html = generate_post_link(post)
+            links.append(link_html)
+            offset += len(link_html)
+        
+        if limit and len(posts) > limit:
+            links.append(ARCHIVE_LINK_HTML)
+        
+        self.html = '\n'.join(links)
+    
+    def render(self, current_post=None):
+        """Return the sidebar HTML with current_post highlighted"""
+        offset = self.offsets.get(current_post.source_path) if current_post else None
+        if offset is None:
+            return self.html
+        return self.html[:offset] + ' current' + self.html[offset:]
+
+class SharedNavLinks:
+    """Stands in for PostLinks in --shared-nav mode, where pages load the post list from NAV_FILE"""
+    
+    html = SHARED_NAV_HTML
+    
+    def render(self, current_post=None):
+        """Return the placeholder scripts.js fills in; it marks the current post itself"""
+        return self.html
+
+def make_post_links(posts, options):
+    """Return the sidebar to embed in pages for these build options"""
+    if options.shared_nav:
+        return SharedNavLinks()
+    return PostLinks(posts, options.sidebar_limit)
+
+def has_archive(options):
+    """Return True if these build options link to an archive page"""
+    return bool(options.shared_nav or options.sidebar_limit or options.page_size)
+
+def generate_post_links(posts, current_post=None):
+    """Generate HTML for the post links sidebar"""
+    return PostLinks(posts).render(current_post)
 
 def generate_tags_html(tags):
     """Generate HTML for post tags"""
@@ -607,36 +1711,48 @@ def generate_tags_html(tags):
     
     return ' '.join(tags_html)
 
-def generate_post_html(post, posts, site_name):
-    """Generate HTML for a single post"""
-    post_links = generate_post_links(posts, post)
-    tags_html = generate_tags_html(post['tags'])
+def generate_post_html(post, posts, site_name, post_links=None, srcsets=None, options=None):
+    """Generate HTML for a single post
+    
+    Pass post_links (a PostLinks for posts) when generating many pages so the
+    sidebar is only built once, and srcsets (from process_responsive_images)
+    to point the post's images at their resized variants.
+    """
+    if post_links is None:
+        post_links = PostLinks(posts)
+    tags_html = generate_tags_html(post.tags)
     
     return HTML_TEMPLATE.format(
-        title=post['title'],
+        title=post.title,
         site_name=site_name,
-        date_iso=post['date_iso'],
-        date_display=post['date_display'],
-        content=post['content'],
+        date_iso=post.date_iso,
+        date_display=post.date_display,
+        content=add_image_srcsets(post.content, srcsets),
         tags=tags_html,
-        post_links=post_links
+        post_links=post_links.render(post),
+        **page_assets(options, post)
     )
 
-def generate_index_html(posts, site_name):
-    """Generate HTML for the index page"""
+def generate_index_html(posts, site_name, post_links=None, page_size=0, srcsets=None, options=None):
+    """Generate HTML for the index page
+    
+    With a page_size the latest post is followed by links to the next few
+    posts and to /page/2/.
+    """
     if not posts:
         return f"<h1>Welcome to {site_name}</h1><p>No posts yet!</p>"
     
     latest_post = posts[0]
-    post_links = generate_post_links(posts, latest_post)
-    tags_html = generate_tags_html(latest_post['tags'])
+    if post_links is None:
+        post_links = PostLinks(posts)
+    tags_html = generate_tags_html(latest_post.tags)
     
     latest_post_html = f"""<article>
-        <h1>{latest_post['title']}</h1>
-        <time datetime="{latest_post['date_iso']}">{latest_post['date_display']}</time>
+        <h1>{latest_post.title}</h1>
+        <time datetime="{latest_post.date_iso}">{latest_post.date_display}</time>
         
         <div class="content">
-            {latest_post['content']}
+            {add_image_srcsets(latest_post.content, srcsets)}
         </div>
         
         <div class="tags">
@@ -644,160 +1760,1805 @@ def generate_index_html(posts, site_name):
         </div>
     </article>"""
     
+    if page_size:
+        older_url = listing_page_url('/', 2) if len(posts) > page_size else None
+        latest_post_html += generate_post_list_html("More posts", posts[1:page_size], None, older_url)
+    
     return INDEX_TEMPLATE.format(
         site_name=site_name,
-        post_links=post_links,
-        latest_post=latest_post_html
+        post_links=post_links.render(latest_post),
+        latest_post=latest_post_html,
+        **page_assets(options, latest_post)
     )
 
-def generate_rss_feed(posts, site_name):
-    """Generate RSS feed XML"""
-    items = []
-    for post in posts:
-        # Handle date that might be a string or datetime object
-        date_value = post['date']
-        if isinstance(date_value, str):
-            try:
-                date_obj = dateutil_parser.parse(date_value)
-            except ValueError:
-                date_obj = datetime.now()
-        else:
-            # Already a datetime or date object
-            date_obj = date_value
-            
-        url = f"/{date_obj.year}/{date_obj.month:02d}/{date_obj.day:02d}/"
-        
-        item = RSS_ITEM_TEMPLATE.format(
-            title=post['title'],
-            site_name=site_name,
-            url=url,
-            content=post['content'],
-            pub_date=format_rfc822_date(date_value)
-        )
-        items.append(item)
-    
-    rss = RSS_TEMPLATE.format(
-        site_name=site_name,
-        build_date=format_rfc822_date(datetime.now()),
-        items='\n'.join(items)
-    )
-    
-    return rss
+def listing_page_url(base_url, page):
+    """Return the URL of page number page of a listing starting at base_url"""
+    if page == 1:
+        return base_url
+    return f"{base_url}page/{page}/"
 
-def create_output_directories(output_dir, posts):
-    """Create output directories for posts"""
-    for post in posts:
-        # Handle date that might be a string or datetime object
-        date_value = post['date']
-        if isinstance(date_value, str):
-            try:
-                date_obj = dateutil_parser.parse(date_value)
-            except ValueError:
-                # If we can't parse the date format, use today's date
-                print(f"Warning: Could not parse date '{date_value}' for post '{post['title']}'. Using today's date.")
-                date_obj = datetime.now()
-        else:
-            # Already a datetime object
-            date_obj = date_value
-        
-        post_dir = os.path.join(
-            output_dir,
-            str(date_obj.year),
-            f"{date_obj.month:02d}",
-            f"{date_obj.day:02d}"
-        )
-        os.makedirs(post_dir, exist_ok=True)
+def generate_pager_html(newer_url=None, older_url=None):
+    """Generate the newer/older links of a paginated listing"""
+    links = []
+    if newer_url:
+        links.append(f'<a class="newer" href="{newer_url}">&larr; Newer posts</a>')
+    if older_url:
+        links.append(f'<a class="older" href="{older_url}">Older posts &rarr;</a>')
+    if not links:
+        return ''
+    return f'<nav class="pager">{" ".join(links)}</nav>'
+
+def generate_post_list_html(title, posts, newer_url=None, older_url=None):
+    """Generate an article listing posts by date and title"""
+    links = '\n'.join(generate_post_link(post) for post in posts)
+    return f"""<article>
+        <h1>{title}</h1>
+        <div class="post-list">
+            {links}
+        </div>
+        {generate_pager_html(newer_url, older_url)}
+    </article>"""
+
+def generate_listing_html(title, posts, site_name, post_links, newer_url=None, older_url=None, options=None):
+    """Generate HTML for a listing page"""
+    return INDEX_TEMPLATE.format(
+        site_name=site_name,
+        post_links=post_links.render(),
+        latest_post=generate_post_list_html(title, posts, newer_url, older_url),
+        **page_assets(options)
+    )
+
+def generate_archive_html(posts, site_name, post_links=None, by_year=False, options=None):
+    """Generate HTML for the archive page
+    
+    The archive lists every post, or with by_year only links to the yearly
+    listings so its size stays bounded.
+    """
+    if post_links is None:
+        post_links = PostLinks(posts)
+    
+    if not by_year:
+        return generate_listing_html("Archive", posts, site_name, post_links, options=options)
+    
+    years = []
+    for year, year_posts in group_posts_by_year(posts):
+        years.append(f"""<div class="post-link">
+            <a href="/{year}/">
+                <span class="date">{year}</span>
+                <span class="title">{len(year_posts)} posts</span>
+            </a>
+        </div>""")
+    
+    archive_html = f"""<article>
+        <h1>Archive</h1>
+        <div class="post-list">
+            {chr(10).join(years)}
+        </div>
+    </article>"""
+    
+    return INDEX_TEMPLATE.format(
+        site_name=site_name,
+        post_links=post_links.render(),
+        latest_post=archive_html,
+        **page_assets(options)
+    )
+
+def group_posts_by_year(posts):
+    """Return [(year, posts)] for date-sorted posts, newest year first"""
+    groups = []
+    for post in posts:
+        if not groups or groups[-1][0] != post.date.year:
+            groups.append((post.date.year, []))
+        groups[-1][1].append(post)
+    return groups
+
+def summarize_html(content):
+    """Return the first paragraph of rendered post HTML"""
+    match = re.search(r'<p>.*?</p>', content, re.DOTALL)
+    return match.group(0) if match else content
+
+def generate_rss_item(post, site_name, summary=False):
+    """Generate the RSS <item> for a single post"""
+    return RSS_ITEM_TEMPLATE.format(
+        title=post.title,
+        site_name=site_name,
+        url=post.url,
+        content=summarize_html(post.content) if summary else post.content,
+        pub_date=post.date_rfc822
+    )
+
+def get_feed_posts(posts, options):
+    """Return the posts that go into the feed, the newest feed_limit of them"""
+    return posts[:options.feed_limit] if options.feed_limit else posts
+
+def feed_item_key(post, site_name, options, cache):
+    """Return the fragment cache key for a post's RSS item
+    
+    The URL and date are part of it, since for a post without a date they
+    come from the time it was scanned rather than from its source.
+    """
+    h = hashlib.sha256(cache.file_key(post.source_path).encode('ascii'))
+    h.update(f"\0{post.url}\0{post.date_rfc822}".encode('utf-8'))
+    h.update(f"\0{site_name}\0{options.feed_summary}\0{RSS_ITEM_TEMPLATE}".encode('utf-8'))
+    return 'rss-' + h.hexdigest()
+
+def generate_feed_item(post, site_name, options, cache=None):
+    """Return a post's RSS item, from the fragment cache when its source is unchanged
+    
+    post may be metadata only; its body is only rendered on a cache miss.
+    """
+    key = None
+    if cache is not None:
+        key = feed_item_key(post, site_name, options, cache)
+        item = cache.get_fragment(key)
+        if item is not None:
+            return item
+    
+    if post.content is None:
+        post = render_scanned_post(post, cache)
+    item = generate_rss_item(post, site_name, options.feed_summary)
+    if cache is not None:
+        cache.put_fragment(key, item)
+    return item
+
+def feed_build_date(feed_posts):
+    """Return the feed's lastBuildDate
+    
+    This is the newest post's date rather than the time of the build, so
+    rebuilding an unchanged feed produces an identical file.
+    """
+    if feed_posts:
+        return feed_posts[0].date_rfc822
+    return format_rfc822_date(datetime.now())
+
+def split_rss_template(site_name, feed_posts):
+    """Return the RSS feed text before and after the items, for writing items as they are produced"""
+    items_marker = '\0'
+    rss_head, rss_tail = RSS_TEMPLATE.format(
+        site_name=site_name,
+        build_date=feed_build_date(feed_posts),
+        items=items_marker
+    ).split(items_marker)
+    return rss_head, rss_tail
+
+def generate_rss_feed(posts, site_name):
+    """Generate RSS feed XML"""
+    items = [generate_rss_item(post, site_name) for post in posts]
+    
+    rss = RSS_TEMPLATE.format(
+        site_name=site_name,
+        build_date=feed_build_date(posts),
+        items='\n'.join(items)
+    )
+    
+    return rss
+
+def create_output_directories(output_dir, posts):
+    """Create output directories for posts"""
+    post_dirs = {os.path.dirname(post.output_path) for post in posts}
+    for post_dir in post_dirs:
+        os.makedirs(os.path.join(output_dir, post_dir), exist_ok=True)
+
+# Files written and files skipped as unchanged during the current build
+output_counts = {'written': 0, 'skipped': 0}
+
+def reset_output_counts():
+    """Start counting written and skipped output files from zero"""
+    output_counts['written'] = 0
+    output_counts['skipped'] = 0
+
+def is_image_file(file_name):
+    """Return True if file_name has one of the copied image extensions"""
+    return file_name.lower().endswith(tuple(IMAGE_EXTENSIONS))
+
+class ImageCollisionError(Exception):
+    """Two images in the content directory would be copied to the same img/ path"""
+
+def find_image_files(content_dir, output_dir):
+    """Return {file name: source path} for every image under content_dir
+    
+    Images are copied into one flat img/ directory, so two images with the
+    same name anywhere in the tree are an error rather than one silently
+    replacing the other.
+    """
+    images = {}
+    for root, dirs, files in os.walk(content_dir):
+        # The output directory may live inside the content directory
+        dirs[:] = sorted(d for d in dirs if os.path.join(root, d) != output_dir)
+        for file in sorted(files):
+            if is_image_file(file):
+                src_path = os.path.join(root, file)
+                if file in images:
+                    raise ImageCollisionError(
+                        f"Images {images[file]} and {src_path} would both be copied to img/{file}")
+                images[file] = src_path
+    return images
 
 def copy_image_files(content_dir, output_dir):
-    """Copy image files from content directory to output directory"""
-    img_extensions = ['.jpg', '.jpeg', '.png', '.gif', '.svg']
+    """Sync image files from the content directory into the output's img/ directory
+    
+    An image whose copy already has the same size and mtime is skipped after
+    two stat calls. Only new or changed images are copied, and images whose
+    source is gone are removed. Returns {file name: source path} of the images.
+    """
     img_dir = os.path.join(output_dir, 'img')
     os.makedirs(img_dir, exist_ok=True)
+    images = find_image_files(content_dir, output_dir)
     
-    for root, _, files in os.walk(content_dir):
-        for file in files:
-            if any(file.lower().endswith(ext) for ext in img_extensions):
-                src_path = os.path.join(root, file)
-                dest_path = os.path.join(img_dir, file)
-                shutil.copy2(src_path, dest_path)
-                print(f"Copied image: {file}")
+    for file, src_path in images.items():
+        dest_path = os.path.join(img_dir, file)
+        src_stat = os.stat(src_path)
+        try:
+            dest_stat = os.stat(dest_path)
+        except FileNotFoundError:
+            dest_stat = None
+        
+        if dest_stat is not None and dest_stat.st_size == src_stat.st_size:
+            if dest_stat.st_mtime_ns == src_stat.st_mtime_ns:
+                output_counts['skipped'] += 1
+                continue
+            if hash_file(src_path) == hash_file(dest_path):
+                # Same bytes with a new mtime, e.g. after a fresh checkout
+                shutil.copystat(src_path, dest_path)
+                output_counts['skipped'] += 1
+                continue
+        
+        tmp_path = f"{dest_path}.{os.getpid()}.tmp"
+        shutil.copy2(src_path, tmp_path)
+        os.replace(tmp_path, dest_path)
+        output_counts['written'] += 1
+        print(f"Copied image: {file}")
+    
+    for file in os.listdir(img_dir):
+        path = os.path.join(img_dir, file)
+        # Compressed siblings of images (from --precompress) are left to precompress_outputs
+        base, suffix = os.path.splitext(file)
+        if suffix in COMPRESSED_SUFFIXES and base in images:
+            continue
+        if file not in images and os.path.isfile(path):
+            os.remove(path)
+            print(f"Removed image: {file}")
+    
+    return images
+
+def image_variants_settings(options):
+    """Return everything besides the source image that affects its variants"""
+    return {
+        'version': IMAGE_VARIANTS_VERSION,
+        'widths': list(options.image_widths),
+        'format': options.image_format,
+        'quality': IMAGE_QUALITY
+    }
+
+def image_variant_path(file, width, image_format):
+    """Return the path of an image variant relative to img/"""
+    ext = 'jpg' if image_format == 'jpeg' else image_format
+    return f"{width}/{file}.{ext}"
+
+def make_image_variants(src_path, img_dir, settings, cache=None):
+    """Write the resized variants of one image into img_dir
+    
+    Runs in a worker process. Variants are served from the cache when one
+    with the same source bytes and settings was made before, and are saved
+    without EXIF metadata. Returns (sha256, width, height, variant widths,
+    cache hits), with width and height None if the image cannot be read.
+    """
+    file = os.path.basename(src_path)
+    ext = 'jpg' if settings['format'] == 'jpeg' else settings['format']
+    with open(src_path, 'rb') as f:
+        digest = hashlib.sha256(f.read()).hexdigest()
+    settings_key = json.dumps(settings, sort_keys=True)
+    
+    hits = 0
+    try:
+        image = Image.open(src_path)
+    except OSError:
+        return digest, None, None, [], hits
+    
+    with image:
+        width, height = image.size
+        # Orientations 5 to 8 are rotated by 90 degrees
+        if image.getexif().get(0x0112) in (5, 6, 7, 8):
+            width, height = height, width
+        
+        widths = [w for w in settings['widths'] if w < width]
+        transposed = None
+        for w in widths:
+            dest_path = os.path.join(img_dir, image_variant_path(file, w, settings['format']))
+            os.makedirs(os.path.dirname(dest_path), exist_ok=True)
+            tmp_path = f"{dest_path}.{os.getpid()}.tmp"
+            
+            cache_path = None
+            if cache is not None:
+                key = hashlib.sha256(f"{digest}\0{settings_key}\0{w}".encode('utf-8')).hexdigest()
+                cache_path = cache.image_path(key, ext)
+                if os.path.exists(cache_path):
+                    shutil.copyfile(cache_path, tmp_path)
+                    os.replace(tmp_path, dest_path)
+                    hits += 1
+                    continue
+            
+            # Only decode the image once some variant is actually missing
+            if transposed is None:
+                transposed = ImageOps.exif_transpose(image)
+                if settings['format'] == 'jpeg' and transposed.mode != 'RGB':
+                    transposed = transposed.convert('RGB')
+            resized = transposed.resize((w, max(1, round(height * w / width))), Image.LANCZOS)
+            resized.save(tmp_path, format=settings['format'].upper(), quality=settings['quality'])
+            
+            if cache_path is not None:
+                os.makedirs(os.path.dirname(cache_path), exist_ok=True)
+                cache_tmp_path = f"{cache_path}.{os.getpid()}.tmp"
+                shutil.copyfile(tmp_path, cache_tmp_path)
+                os.replace(cache_tmp_path, cache_path)
+            os.replace(tmp_path, dest_path)
+    
+    return digest, width, height, widths, hits
+
+def load_image_index(output_dir):
+    """Return the image index of the previous build, or {} if there is none"""
+    try:
+        with open(os.path.join(output_dir, IMAGE_INDEX_FILE), 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+def save_image_index(output_dir, index):
+    """Write the image index atomically"""
+    index_path = os.path.join(output_dir, IMAGE_INDEX_FILE)
+    tmp_path = f"{index_path}.{os.getpid()}.tmp"
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(index, f, sort_keys=True)
+    os.replace(tmp_path, index_path)
+
+def remove_stale_image_variants(img_dir, expected):
+    """Remove the files under img/<width>/ whose path relative to img/ is not in expected"""
+    for entry in os.scandir(img_dir):
+        if not entry.is_dir() or not entry.name.isdigit():
+            continue
+        for variant in os.scandir(entry.path):
+            if f"{entry.name}/{variant.name}" not in expected:
+                os.remove(variant.path)
+                print(f"Removed image variant: {entry.name}/{variant.name}")
+        if not os.listdir(entry.path):
+            os.rmdir(entry.path)
+
+def process_responsive_images(images, output_dir, options, jobs=1, cache=None):
+    """Make resized variants of the images for srcset, in parallel
+    
+    images is the {file name: source path} returned by copy_image_files.
+    An image whose size, mtime and settings match the previous build's index
+    is only stat'ed. Returns {file name: srcset} for add_image_srcsets, or
+    None when Pillow is not installed.
+    """
+    img_dir = os.path.join(output_dir, 'img')
+    if not options.image_widths:
+        # Clean up after a previous build with --responsive-images
+        remove_stale_image_variants(img_dir, set())
+        if os.path.exists(os.path.join(output_dir, IMAGE_INDEX_FILE)):
+            os.remove(os.path.join(output_dir, IMAGE_INDEX_FILE))
+        return None
+    if Image is None:
+        print("Pillow is not installed, images are copied without resized variants")
+        return None
+    
+    settings = image_variants_settings(options)
+    old_index = load_image_index(output_dir)
+    index = {}
+    to_process = []
+    
+    for file, src_path in images.items():
+        if not file.lower().endswith(tuple(RESPONSIVE_IMAGE_EXTENSIONS)):
+            continue
+        st = os.stat(src_path)
+        entry = old_index.get(file)
+        if (entry is not None and entry['size'] == st.st_size and entry['mtime_ns'] == st.st_mtime_ns
+                and entry['settings'] == settings
+                and all(os.path.exists(os.path.join(img_dir, image_variant_path(file, w, options.image_format)))
+                        for w in entry['variants'])):
+            index[file] = entry
+            output_counts['skipped'] += len(entry['variants'])
+        else:
+            index[file] = {'size': st.st_size, 'mtime_ns': st.st_mtime_ns, 'settings': settings}
+            to_process.append(file)
+    
+    jobs = resolve_jobs(jobs)
+    paths = [images[file] for file in to_process]
+    if jobs > 1 and len(paths) > 1:
+        with ProcessPoolExecutor(max_workers=jobs, mp_context=get_pool_context()) as pool:
+            results = list(pool.map(make_image_variants, paths, [img_dir] * len(paths),
+                                    [settings] * len(paths), [cache] * len(paths)))
+    else:
+        results = [make_image_variants(path, img_dir, settings, cache) for path in paths]
+    
+    for file, (digest, width, height, widths, hits) in zip(to_process, results):
+        if width is None:
+            print(f"Warning: Could not read image {images[file]}, it is copied without resized variants")
+        index[file].update(sha256=digest, width=width, height=height, variants=widths)
+        output_counts['written'] += len(widths)
+        if cache is not None:
+            cache.image_hits += hits
+            cache.image_misses += len(widths) - hits
+        if widths:
+            print(f"Resized image: {file} ({len(widths)} variants)")
+    
+    # Drop variants of removed images and of widths no longer configured
+    remove_stale_image_variants(img_dir, {image_variant_path(file, w, options.image_format)
+                                          for file, entry in index.items() for w in entry['variants']})
+    save_image_index(output_dir, index)
+    
+    srcsets = {}
+    for file, entry in index.items():
+        if entry['variants']:
+            urls = [f"/img/{urllib.parse.quote(image_variant_path(file, w, options.image_format))} {w}w"
+                    for w in entry['variants']]
+            urls.append(f"/img/{urllib.parse.quote(file)} {entry['width']}w")
+            srcsets[file] = ', '.join(urls)
+    return srcsets
+
+def add_image_srcsets(html, srcsets):
+    """Add srcset and sizes to the <img> tags in html that show an image with resized variants"""
+    if not srcsets:
+        return html
+    
+    def add_srcset(match):
+        tag = match.group(0)
+        if ' srcset=' in tag:
+            return tag
+        srcset = srcsets.get(urllib.parse.unquote(match.group(1)))
+        if srcset is None:
+            return tag
+        return f'{tag[:-len(match.group(2))]} srcset="{srcset}" sizes="{IMAGE_SIZES}"{match.group(2)}'
+    
+    return IMG_TAG_RE.sub(add_srcset, html)
+
+def write_output_file(path, content):
+    """Write a generated file, leaving it (and its mtime) alone if the content is unchanged
+    
+    Changed files are written to a temporary file and moved into place with
+    os.replace, so readers never see a half written file.
+    """
+    data = content.encode('utf-8')
+    try:
+        if os.path.getsize(path) == len(data):
+            with open(path, 'rb') as f:
+                if f.read() == data:
+                    output_counts['skipped'] += 1
+                    return False
+    except OSError:
+        pass
+    
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with open(tmp_path, 'wb') as f:
+        f.write(data)
+    os.replace(tmp_path, path)
+    
+    output_counts['written'] += 1
+    print(f"Generated: {path}")
+    return True
+
+class AtomicOutputFile:
+    """Streamed counterpart of write_output_file, for outputs too large to build in memory
+    
+    Text is written to a temporary file, which replaces path on close only if
+    the content differs from what is already there.
+    """
+    
+    def __init__(self, path):
+        self.path = path
+        self.tmp_path = f"{path}.{os.getpid()}.tmp"
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        self.file = open(self.tmp_path, 'w', encoding='utf-8')
+    
+    def write(self, text):
+        self.file.write(text)
+    
+    def __enter__(self):
+        return self
+    
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.file.close()
+        if exc_type is not None:
+            os.remove(self.tmp_path)
+            return False
+        
+        if os.path.exists(self.path) and filecmp.cmp(self.tmp_path, self.path, shallow=False):
+            os.remove(self.tmp_path)
+            output_counts['skipped'] += 1
+        else:
+            os.replace(self.tmp_path, self.path)
+            output_counts['written'] += 1
+            print(f"Generated: {self.path}")
+        return False
+
+def get_post_path(output_dir, post):
+    """Return the output path of a post's index.html"""
+    return os.path.join(output_dir, post.output_path)
+
+def used_assets(options=None):
+    """Return the plain names of the static assets the pages link to"""
+    names = ['style.css', 'scripts.js']
+    if options is not None and options.server_highlight:
+        names.append('pygments.css')
+    return names
+
+def write_static_files(output_dir, options=None):
+    """Write the static assets under their hashed names, and the asset manifest
+    
+    A changed asset gets a new name, so the old one is removed, as are
+    assets the pages no longer link to.
+    """
+    asset_names = {name: ASSET_NAMES[name] for name in used_assets(options)}
+    for name, hashed_name in asset_names.items():
+        write_page(output_dir, hashed_name, STATIC_ASSETS[name])
+    write_page(output_dir, ASSET_MANIFEST_FILE, json.dumps(asset_names, indent=2, sort_keys=True) + '\n')
+    
+    for name in STATIC_ASSETS:
+        stem, ext = os.path.splitext(name)
+        pattern = re.compile(re.escape(stem) + r'(\.[0-9a-f]{10})?' + re.escape(ext))
+        for file in os.listdir(output_dir):
+            if pattern.fullmatch(file) and file != asset_names.get(name):
+                os.remove(os.path.join(output_dir, file))
+                print(f"Removed: {os.path.join(output_dir, file)}")
 
-def write_output_files(output_dir, posts, site_name):
+def write_page(output_dir, rel_path, content):
+    """Write a generated file at rel_path inside the output directory"""
+    return write_output_file(os.path.join(output_dir, rel_path), content)
+
+def write_nav_file(output_dir, posts, options):
+    """Write the shared post list loaded by --shared-nav pages"""
+    write_page(output_dir, NAV_FILE, PostLinks(posts, options.sidebar_limit).html)
+
+def write_listing_pages(output_dir, posts, site_name, options, post_links):
+    """Write the archive and paginated listing pages, returning their relative paths
+    
+    Readers without JavaScript (--shared-nav) and capped sidebars link to the
+    archive. With a page size there are also /page/N/ pages continuing the
+    index and a listing per year at /YYYY/.
+    """
+    written = []
+    
+    def write_listing(rel_dir, html):
+        rel_path = os.path.join(rel_dir, 'index.html')
+        write_page(output_dir, rel_path, html)
+        written.append(rel_path)
+    
+    if has_archive(options):
+        write_listing(ARCHIVE_DIR, generate_archive_html(posts, site_name, post_links,
+                                                         by_year=bool(options.page_size), options=options))
+    
+    if not options.page_size:
+        return written
+    
+    size = options.page_size
+    # Page 1 of the main listing is the index itself
+    pages = [posts[i:i + size] for i in range(0, len(posts), size)]
+    for number, page_posts in enumerate(pages[1:], start=2):
+        newer_url = listing_page_url('/', number - 1)
+        older_url = listing_page_url('/', number + 1) if number < len(pages) else None
+        write_listing(f"page/{number}", generate_listing_html(
+            f"Posts, page {number}", page_posts, site_name, post_links, newer_url, older_url, options))
+    
+    for year, year_posts in group_posts_by_year(posts):
+        base_url = f"/{year}/"
+        pages = [year_posts[i:i + size] for i in range(0, len(year_posts), size)]
+        for number, page_posts in enumerate(pages, start=1):
+            newer_url = listing_page_url(base_url, number - 1) if number > 1 else None
+            older_url = listing_page_url(base_url, number + 1) if number < len(pages) else None
+            title = str(year) if number == 1 else f"{year}, page {number}"
+            rel_dir = str(year) if number == 1 else f"{year}/page/{number}"
+            write_listing(rel_dir, generate_listing_html(
+                title, page_posts, site_name, post_links, newer_url, older_url, options))
+    
+    return written
+
+def write_output_files(output_dir, posts, site_name, options=None, cache=None, srcsets=None):
     """Write all output files"""
+    if options is None:
+        options = BuildOptions()
+    
     # Create output directories
     create_output_directories(output_dir, posts)
     
+    # The sidebar is the same on every page, build it once
+    post_links = make_post_links(posts, options)
+    if options.shared_nav:
+        write_nav_file(output_dir, posts, options)
+    write_listing_pages(output_dir, posts, site_name, options, post_links)
+    
     # Write post files
     for post in posts:
-        # Handle date that might be a string or datetime object
-        date_value = post['date']
-        if isinstance(date_value, str):
+        write_page(output_dir, post.output_path, generate_post_html(post, posts, site_name, post_links, srcsets, options))
+    
+    # Write index file
+    write_page(output_dir, 'index.html',
+               generate_index_html(posts, site_name, post_links, options.page_size, srcsets, options))
+    
+    # Write RSS feed
+    write_rss_feed(output_dir, posts, site_name, options, cache)
+    
+    write_static_files(output_dir, options)
+
+def write_output_files_streaming(output_dir, posts, site_name, jobs=1, cache=None, options=None, srcsets=None):
+    """Write all output files, rendering one post body at a time
+    
+    posts only holds metadata (see scan_posts). Each body is rendered, written
+    to its page and appended to the feed, then dropped, so peak memory does
+    not grow with the size of the archive.
+    """
+    if options is None:
+        options = BuildOptions()
+    
+    # Create output directories
+    create_output_directories(output_dir, posts)
+    
+    # The feed is written around the items as they are produced
+    rss_head, rss_tail = split_rss_template(site_name, get_feed_posts(posts, options))
+    
+    # The sidebar is the same on every page, build it once
+    post_links = make_post_links(posts, options)
+    if options.shared_nav:
+        write_nav_file(output_dir, posts, options)
+    write_listing_pages(output_dir, posts, site_name, options, post_links)
+    
+    latest_post = None
+    with AtomicOutputFile(os.path.join(output_dir, 'feed.xml')) as rss:
+        rss.write(rss_head)
+        
+        paths = [post.source_path for post in posts]
+        for i, rendered in enumerate(iter_rendered_posts(paths, jobs, cache)):
+            post = with_metadata(posts[i], rendered)
+            write_page(output_dir, post.output_path, generate_post_html(post, posts, site_name, post_links, srcsets, options))
+            
+            if not options.feed_limit or i < options.feed_limit:
+                if i > 0:
+                    rss.write('\n')
+                rss.write(generate_feed_item(post, site_name, options, cache))
+            
+            # The index only needs the newest body, keep that one
+            if i == 0:
+                latest_post = post
+        
+        rss.write(rss_tail)
+    
+    # Write index file
+    index_posts = [latest_post] + posts[1:] if latest_post else posts
+    write_page(output_dir, 'index.html',
+               generate_index_html(index_posts, site_name, post_links, options.page_size, srcsets, options))
+    
+    write_static_files(output_dir, options)
+
+def compress_file(path, use_brotli):
+    """Write .gz (and .br) siblings of path at maximum compression; runs in a worker process
+    
+    The siblings get path's mtime, which is how later builds tell that they
+    are up to date.
+    """
+    with open(path, 'rb') as f:
+        data = f.read()
+    st = os.stat(path)
+    
+    # mtime=0 keeps the gzip header, and so the file, the same for the same content
+    siblings = [(path + '.gz', gzip.compress(data, compresslevel=9, mtime=0))]
+    if use_brotli:
+        siblings.append((path + '.br', brotli.compress(data, quality=11)))
+    
+    for sibling_path, compressed in siblings:
+        tmp_path = f"{sibling_path}.{os.getpid()}.tmp"
+        with open(tmp_path, 'wb') as f:
+            f.write(compressed)
+        os.utime(tmp_path, ns=(st.st_atime_ns, st.st_mtime_ns))
+        os.replace(tmp_path, sibling_path)
+    return path
+
+def precompress_outputs(output_dir, jobs=1):
+    """Write compressed siblings of every text output whose content changed, in parallel
+    
+    Outputs are only rewritten when their content changes, so a sibling
+    whose mtime matches its file's is up to date and costs a stat call.
+    Siblings of removed outputs are removed.
+    """
+    use_brotli = brotli is not None
+    to_compress = []
+    unchanged = 0
+    for root, _, files in os.walk(output_dir):
+        names = set(files)
+        for file in files:
+            path = os.path.join(root, file)
+            base, suffix = os.path.splitext(file)
+            if suffix in COMPRESSED_SUFFIXES:
+                if base not in names:
+                    os.remove(path)
+                    print(f"Removed: {path}")
+                continue
+            if not file.endswith(tuple(COMPRESSIBLE_EXTENSIONS)):
+                continue
+            
+            mtime = os.stat(path).st_mtime_ns
+            up_to_date = True
+            for sibling_suffix in COMPRESSED_SUFFIXES:
+                try:
+                    sibling_mtime = os.stat(path + sibling_suffix).st_mtime_ns
+                except FileNotFoundError:
+                    sibling_mtime = None
+                if sibling_suffix == '.br' and not use_brotli:
+                    # A .br left from a build with brotli would be stale once the file changes
+                    if sibling_mtime is not None and sibling_mtime != mtime:
+                        os.remove(path + sibling_suffix)
+                    continue
+                up_to_date = up_to_date and sibling_mtime == mtime
+            
+            if up_to_date:
+                unchanged += 1
+            else:
+                to_compress.append(path)
+    
+    jobs = resolve_jobs(jobs)
+    if jobs > 1 and len(to_compress) > 1:
+        chunksize = max(1, len(to_compress) // (jobs * 4))
+        with ProcessPoolExecutor(max_workers=jobs, mp_context=get_pool_context()) as pool:
+            list(pool.map(compress_file, to_compress, [use_brotli] * len(to_compress), chunksize=chunksize))
+    else:
+        for path in to_compress:
+            compress_file(path, use_brotli)
+    
+    formats = 'gzip and brotli' if use_brotli else 'gzip'
+    print(f"Precompressed ({formats}): {len(to_compress)} files compressed, {unchanged} unchanged")
+
+def remove_compressed_siblings(output_dir):
+    """Remove the .gz and .br siblings a previous build with --precompress wrote
+    
+    Without --precompress they are no longer updated, and a web server
+    serving precompressed files would keep sending their old content.
+    """
+    for root, _, files in os.walk(output_dir):
+        for file in files:
+            base, suffix = os.path.splitext(file)
+            if suffix in COMPRESSED_SUFFIXES and base.endswith(tuple(COMPRESSIBLE_EXTENSIONS)):
+                path = os.path.join(root, file)
+                os.remove(path)
+                print(f"Removed: {path}")
+
+def build_fingerprint(site_name, options):
+    """Hash everything besides the posts themselves that affects the generated pages"""
+    h = hashlib.sha256()
+    for part in (
+        str(RENDER_CACHE_VERSION), markdown.__version__, pygments.__version__, str(latex2mathml_version()),
+        json.dumps([MARKDOWN_EXTENSIONS, MARKDOWN_EXTENSION_CONFIGS, markdown_renderer.unlabeled_code], sort_keys=True),
+        HTML_TEMPLATE, INDEX_TEMPLATE, RSS_TEMPLATE, RSS_ITEM_TEMPLATE,
+        STYLE_CSS, SCRIPTS_JS, site_name, options.fingerprint()
+    ):
+        h.update(part.encode('utf-8'))
+        h.update(b'\0')
+    return h.hexdigest()
+
+def sidebar_digest(posts):
+    """Hash the post list shown in the sidebar of every page"""
+    h = hashlib.sha256()
+    for post in posts:
+        h.update(f"{post.url}\0{post.date_display}\0{post.title}\0".encode('utf-8'))
+    return h.hexdigest()
+
+def load_manifest(output_dir):
+    """Load the build manifest from a previous build, or an empty one"""
+    try:
+        with open(os.path.join(output_dir, MANIFEST_FILE), 'r', encoding='utf-8') as f:
+            manifest = json.load(f)
+    except (OSError, ValueError):
+        return {}
+    if manifest.get('version') != MANIFEST_VERSION:
+        return {}
+    return manifest
+
+def save_manifest(output_dir, manifest):
+    """Atomically write the build manifest"""
+    manifest_path = os.path.join(output_dir, MANIFEST_FILE)
+    tmp_path = f"{manifest_path}.{os.getpid()}.tmp"
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        # Tags can hold any YAML scalar; they are only ever rendered as strings
+        json.dump(dict(manifest, version=MANIFEST_VERSION), f, default=str)
+    os.replace(tmp_path, manifest_path)
+
+def hash_file(file_path):
+    """Return the sha256 hex digest of a file's contents"""
+    h = hashlib.sha256()
+    with open(file_path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b''):
+            h.update(chunk)
+    return h.hexdigest()
+
+def scan_sources_incremental(content_dir, old_sources):
+    """Scan markdown sources, re-reading only files whose size, mtime or hash changed
+    
+    Returns (posts, sources, changed) where sources is the new manifest entry
+    for every file and changed is the set of source paths whose post needs
+    to be rendered again.
+    """
+    posts = []
+    sources = {}
+    changed = set()
+    
+    for file_path in find_markdown_files(content_dir):
+        rel_path = os.path.relpath(file_path, content_dir)
+        st = os.stat(file_path)
+        entry = old_sources.get(rel_path)
+        post = None
+        
+        if entry is None or entry['size'] != st.st_size or entry['mtime_ns'] != st.st_mtime_ns:
+            digest = hash_file(file_path)
+            if entry is not None and entry['sha256'] == digest:
+                # Touched but not modified
+                entry = dict(entry, size=st.st_size, mtime_ns=st.st_mtime_ns)
+            else:
+                front_matter = read_frontmatter(file_path)
+                entry = {
+                    'size': st.st_size,
+                    'mtime_ns': st.st_mtime_ns,
+                    'sha256': digest,
+                    'published': is_published(front_matter)
+                }
+                if entry['published']:
+                    post = post_metadata(front_matter, file_path)
+                    entry['title'] = post.title
+                    entry['date'] = post.date.isoformat()
+                    entry['tags'] = post.tags
+                    entry['outputs'] = [post.output_path]
+                    changed.add(file_path)
+                else:
+                    print(f"Skipping draft: {file_path}")
+        
+        sources[rel_path] = entry
+        if not entry['published']:
+            continue
+        if post is None:
+            post = Post(entry['title'], datetime.fromisoformat(entry['date']), entry['tags'], file_path)
+        posts.append(post)
+    
+    # Sort posts by date (newest first)
+    posts.sort(key=lambda x: x.date, reverse=True)
+    return posts, sources, changed
+
+def remove_stale_outputs(output_dir, stale_paths):
+    """Remove outputs that no post produces any more, along with emptied directories"""
+    for rel_path in stale_paths:
+        path = os.path.join(output_dir, rel_path)
+        if os.path.exists(path):
+            os.remove(path)
+            print(f"Removed: {path}")
+        
+        # Prune the now empty date directories, but never the output dir itself
+        parent = os.path.dirname(path)
+        while parent != output_dir and parent.startswith(output_dir):
             try:
-                date_obj = dateutil_parser.parse(date_value)
-            except ValueError:
-                print(f"Warning: Could not parse date '{date_value}' for post '{post['title']}'. Using today's date.")
-                date_obj = datetime.now()
+                os.rmdir(parent)
+            except OSError:
+                break
+            parent = os.path.dirname(parent)
+
+def write_rss_feed(output_dir, posts, site_name, options, cache=None, items=None):
+    """Write feed.xml, one item at a time from cached fragments or rendered posts
+    
+    items maps source paths to RSS items that are known to be current. With
+    items, returns the same mapping for every post in the feed.
+    """
+    feed_posts = get_feed_posts(posts, options)
+    rss_head, rss_tail = split_rss_template(site_name, feed_posts)
+    written = {} if items is not None else None
+    with AtomicOutputFile(os.path.join(output_dir, 'feed.xml')) as rss:
+        rss.write(rss_head)
+        for i, post in enumerate(feed_posts):
+            if i > 0:
+                rss.write('\n')
+            item = items.get(post.source_path) if items else None
+            if item is None:
+                item = generate_feed_item(post, site_name, options, cache)
+            if written is not None:
+                written[post.source_path] = item
+            rss.write(item)
+        rss.write(rss_tail)
+    return written
+
+def feed_item_digest(source_hash, post):
+    """Hash what a stored RSS item depends on besides the build settings: the source, URL and date"""
+    return hashlib.sha256(f"{source_hash}\0{post.url}\0{post.date_rfc822}".encode('utf-8')).hexdigest()
+
+def load_feed_items(output_dir, fingerprint, content_dir, sources, posts):
+    """Return {source path: RSS item} kept by the last incremental build, for posts that did not change"""
+    try:
+        with open(os.path.join(output_dir, FEED_ITEMS_FILE), 'r', encoding='utf-8') as f:
+            stored = json.load(f)
+    except (OSError, ValueError):
+        return {}
+    if stored.get('version') != MANIFEST_VERSION or stored.get('fingerprint') != fingerprint:
+        return {}
+    posts_by_path = {post.source_path: post for post in posts}
+    items = {}
+    for rel_path, (digest, item) in stored['items'].items():
+        file_path = os.path.join(content_dir, rel_path)
+        post = posts_by_path.get(file_path)
+        if post is not None and rel_path in sources and feed_item_digest(sources[rel_path]['sha256'], post) == digest:
+            items[file_path] = item
+    return items
+
+def save_feed_items(output_dir, fingerprint, content_dir, sources, posts, items):
+    """Atomically write the RSS items of the feed, keyed by feed_item_digest()"""
+    posts_by_path = {post.source_path: post for post in posts}
+    stored = {}
+    for file_path, item in items.items():
+        rel_path = os.path.relpath(file_path, content_dir)
+        stored[rel_path] = [feed_item_digest(sources[rel_path]['sha256'], posts_by_path[file_path]), item]
+    items_path = os.path.join(output_dir, FEED_ITEMS_FILE)
+    tmp_path = f"{items_path}.{os.getpid()}.tmp"
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump({'version': MANIFEST_VERSION, 'fingerprint': fingerprint, 'items': stored}, f)
+    os.replace(tmp_path, items_path)
+
+def build_incremental(content_dir, output_dir, site_name, jobs=1, cache=None, manifest=None, options=None,
+                      srcsets=None):
+    """Rebuild only the pages affected by sources changed since the last build
+    
+    A manifest in the output directory maps every source file (size, mtime
+    and content hash) to the outputs it produced. Changed posts get their
+    page rewritten; the index and feed are rewritten when a post they show
+    changed. Every page embeds the full post list in its sidebar, so a new,
+    removed or retitled post still rewrites every page, unless the post list
+    is shared through NAV_FILE (--shared-nav).
+    
+    Images gaining or losing resized variants (srcsets) rewrite every post
+    page, since only rendered posts show which images they use.
+    
+    Returns the new manifest, which can be passed back in as manifest to
+    skip reloading it from disk on the next build.
+    """
+    if options is None:
+        options = BuildOptions()
+    if manifest is None:
+        manifest = load_manifest(output_dir)
+    fingerprint = build_fingerprint(site_name, options)
+    settings_changed = manifest.get('fingerprint') != fingerprint
+    old_sources = manifest.get('sources', {})
+    
+    # Changed settings mark every source changed, but what they produced is still removed below
+    posts, sources, changed = scan_sources_incremental(content_dir, {} if settings_changed else old_sources)
+    print(f"Found {len(posts)} posts")
+    
+    # The sidebar shows at most sidebar_limit posts, listing pages show them all
+    sidebar = hashlib.sha256(PostLinks(posts, options.sidebar_limit).html.encode('utf-8')).hexdigest()
+    sidebar_changed = settings_changed or manifest.get('sidebar') != sidebar
+    listing = sidebar_digest(posts)
+    listing_changed = settings_changed or manifest.get('listing') != listing
+    images = hashlib.sha256(json.dumps(srcsets, sort_keys=True).encode('utf-8')).hexdigest()
+    # With a shared nav file the post list is not part of any page
+    full_rebuild = (settings_changed or (sidebar_changed and not options.shared_nav)
+                    or manifest.get('images') != images)
+    
+    # Outputs deleted from the output directory are regenerated too
+    to_write = [
+        post for post in posts
+        if full_rebuild or post.source_path in changed
+        or not os.path.exists(get_post_path(output_dir, post))
+    ]
+    
+    old_outputs = {path for entry in old_sources.values() for path in entry.get('outputs', [])}
+    new_outputs = {post.output_path for post in posts}
+    remove_stale_outputs(output_dir, old_outputs - new_outputs)
+    
+    post_links = make_post_links(posts, options)
+    if options.shared_nav and (sidebar_changed or not os.path.exists(os.path.join(output_dir, NAV_FILE))):
+        write_nav_file(output_dir, posts, options)
+    
+    old_listings = set(manifest.get('listings', []))
+    listings = manifest.get('listings', [])
+    if (full_rebuild or listing_changed
+            or not all(os.path.exists(os.path.join(output_dir, path)) for path in listings)):
+        listings = write_listing_pages(output_dir, posts, site_name, options, post_links)
+        # Listing pages that are no longer produced, e.g. a year whose last post was removed
+        remove_stale_outputs(output_dir, old_listings - set(listings) - new_outputs)
+    
+    # The index shows the latest post and the feed the newest feed_limit posts
+    feed = [post.source_path for post in get_feed_posts(posts, options)]
+    feed_paths = set(feed)
+    
+    # Write changed post pages
+    create_output_directories(output_dir, to_write)
+    paths = [post.source_path for post in to_write]
+    # Without the render cache, the feed items of rendered posts are made while their body is at hand
+    in_feed = feed_paths if cache is None else set()
+    fresh_items = {}
+    for post, rendered in zip(to_write, iter_rendered_posts(paths, jobs, cache)):
+        post = with_metadata(post, rendered)
+        write_page(output_dir, post.output_path, generate_post_html(post, posts, site_name, post_links, srcsets, options))
+        if post.source_path in in_feed:
+            fresh_items[post.source_path] = generate_rss_item(post, site_name, options.feed_summary)
+    
+    # A rewritten page may have moved, e.g. a post without a date scanned on another day
+    feed_changed = (feed != manifest.get('feed') or any(path in changed for path in feed)
+                    or any(post.source_path in feed_paths for post in to_write))
+    latest = posts[0].source_path if posts else None
+    index_path = os.path.join(output_dir, 'index.html')
+    if (full_rebuild or latest in changed or latest != manifest.get('latest')
+            or (options.page_size and listing_changed) or not os.path.exists(index_path)):
+        index_posts = [render_scanned_post(posts[0], cache)] + posts[1:] if posts else posts
+        write_page(output_dir, 'index.html',
+                   generate_index_html(index_posts, site_name, post_links, options.page_size, srcsets, options))
+    
+    if full_rebuild or feed_changed or not os.path.exists(os.path.join(output_dir, 'feed.xml')):
+        if cache is None:
+            # Without the render cache only the changed posts in the feed are rendered again
+            items = load_feed_items(output_dir, fingerprint, content_dir, sources, posts)
+            items.update(fresh_items)
+            items = write_rss_feed(output_dir, posts, site_name, options, items=items)
+            save_feed_items(output_dir, fingerprint, content_dir, sources, posts, items)
         else:
-            # Already a datetime object
-            date_obj = date_value
+            write_rss_feed(output_dir, posts, site_name, options, cache)
+    
+    static_paths = [os.path.join(output_dir, name)
+                    for name in [*(ASSET_NAMES[name] for name in used_assets(options)), ASSET_MANIFEST_FILE]]
+    if settings_changed or not all(os.path.exists(path) for path in static_paths):
+        write_static_files(output_dir, options)
+    
+    manifest = {
+        'version': MANIFEST_VERSION,
+        'fingerprint': fingerprint,
+        'sidebar': sidebar,
+        'listing': listing,
+        'listings': listings,
+        'images': images,
+        'latest': latest,
+        'feed': feed,
+        'sources': sources
+    }
+    save_manifest(output_dir, manifest)
+    
+    print(f"Incremental build: {len(to_write)} of {len(posts)} posts rebuilt")
+    return manifest
+
+class InotifyWatcher:
+    """Watch a directory tree for changes with Linux inotify (through ctypes)"""
+    
+    IN_MODIFY = 0x00000002
+    IN_ATTRIB = 0x00000004
+    IN_CLOSE_WRITE = 0x00000008
+    IN_MOVED_FROM = 0x00000040
+    IN_MOVED_TO = 0x00000080
+    IN_CREATE = 0x00000100
+    IN_DELETE = 0x00000200
+    IN_Q_OVERFLOW = 0x00004000
+    IN_IGNORED = 0x00008000
+    IN_ISDIR = 0x40000000
+    
+    WATCH_MASK = (IN_MODIFY | IN_ATTRIB | IN_CLOSE_WRITE | IN_MOVED_FROM
+                  | IN_MOVED_TO | IN_CREATE | IN_DELETE)
+    EVENT_HEADER = struct.Struct('iIII')
+    
+    def __init__(self, root):
+        libc_name = ctypes.util.find_library('c')
+        libc = ctypes.CDLL(libc_name, use_errno=True)
+        if not hasattr(libc, 'inotify_init1'):
+            raise OSError(errno.ENOSYS, "inotify is not available")
+        
+        self.libc = libc
+        self.root = root
+        self.fd = libc.inotify_init1(os.O_NONBLOCK | os.O_CLOEXEC)
+        if self.fd < 0:
+            raise OSError(ctypes.get_errno(), "inotify_init1 failed")
+        self.dirs = {}
+        self.add_tree(root)
+    
+    def add_tree(self, top):
+        """Watch top and every directory below it"""
+        for root, dirs, _ in os.walk(top):
+            wd = self.libc.inotify_add_watch(self.fd, os.fsencode(root), self.WATCH_MASK)
+            if wd >= 0:
+                self.dirs[wd] = root
+    
+    def read_events(self):
+        """Return the paths named by all pending events"""
+        changed = set()
+        try:
+            data = os.read(self.fd, 64 * 1024)
+        except BlockingIOError:
+            return changed
+        
+        offset = 0
+        while offset < len(data):
+            wd, mask, _, name_len = self.EVENT_HEADER.unpack_from(data, offset)
+            offset += self.EVENT_HEADER.size
+            name = os.fsdecode(data[offset:offset + name_len].rstrip(b'\0'))
+            offset += name_len
             
-        post_path = os.path.join(
-            output_dir,
-            str(date_obj.year),
-            f"{date_obj.month:02d}",
-            f"{date_obj.day:02d}",
-            'index.html'
-        )
+            if mask & self.IN_Q_OVERFLOW:
+                # Events were lost, treat the whole tree as changed
+                changed.add(self.root + os.sep)
+                continue
+            if mask & self.IN_IGNORED:
+                self.dirs.pop(wd, None)
+                continue
+            
+            parent = self.dirs.get(wd)
+            if parent is None:
+                continue
+            path = os.path.join(parent, name) if name else parent
+            if mask & self.IN_ISDIR:
+                if mask & (self.IN_CREATE | self.IN_MOVED_TO):
+                    self.add_tree(path)
+                # A trailing separator marks directory events
+                path += os.sep
+            changed.add(path)
+        return changed
+    
+    def wait(self, debounce=WATCH_DEBOUNCE):
+        """Block until something changes, then return the changed paths once things are quiet"""
+        select.select([self.fd], [], [])
+        changed = set()
+        while True:
+            changed |= self.read_events()
+            ready, _, _ = select.select([self.fd], [], [], debounce)
+            if not ready:
+                return changed
+    
+    def close(self):
+        os.close(self.fd)
+
+class PollingWatcher:
+    """Watch a directory tree by comparing scandir snapshots, where inotify is unavailable"""
+    
+    def __init__(self, root, interval=WATCH_POLL_INTERVAL):
+        self.root = root
+        self.interval = interval
+        self.snapshot = self.scan()
+    
+    def scan(self):
+        """Return {path: (size, mtime_ns)} for every file under root"""
+        snapshot = {}
+        stack = [self.root]
+        while stack:
+            try:
+                entries = os.scandir(stack.pop())
+            except OSError:
+                continue
+            with entries:
+                for entry in entries:
+                    try:
+                        if entry.is_dir(follow_symlinks=False):
+                            stack.append(entry.path)
+                        else:
+                            st = entry.stat()
+                            snapshot[entry.path] = (st.st_size, st.st_mtime_ns)
+                    except OSError:
+                        continue
+        return snapshot
+    
+    def diff(self, new_snapshot):
+        """Return the paths that differ between the current and a new snapshot"""
+        old_snapshot = self.snapshot
+        self.snapshot = new_snapshot
+        return {path for path in old_snapshot.keys() | new_snapshot.keys()
+                if old_snapshot.get(path) != new_snapshot.get(path)}
+    
+    def wait(self, debounce=WATCH_DEBOUNCE):
+        """Block until something changes, then return the changed paths once things are quiet"""
+        changed = set()
+        while not changed:
+            time.sleep(self.interval)
+            changed = self.diff(self.scan())
+        while True:
+            time.sleep(debounce)
+            more = self.diff(self.scan())
+            if not more:
+                return changed
+            changed |= more
+    
+    def close(self):
+        pass
+
+def create_watcher(root):
+    """Return an inotify watcher for root, or a polling one if inotify is not available"""
+    try:
+        return InotifyWatcher(root)
+    except (OSError, AttributeError, TypeError):
+        print("inotify not available, polling for changes")
+        return PollingWatcher(root)
+
+def watch(content_dir, output_dir, site_name, jobs=1, cache=None, options=None, srcsets=None, precompress=False):
+    """Rebuild incrementally whenever files under content_dir change
+    
+    The renderer and the build manifest stay in memory between rebuilds,
+    and only the posts, images and aggregate pages affected by a change are
+    written again. A failed rebuild, e.g. of a post saved halfway through
+    an edit, is reported and the next change retries it.
+    """
+    if options is None:
+        options = BuildOptions()
+    watcher = create_watcher(content_dir)
+    
+    def rebuild(manifest):
+        """Build incrementally, returning the new manifest, or the old one if the build failed"""
+        try:
+            manifest = build_incremental(content_dir, output_dir, site_name, jobs=jobs, cache=cache,
+                                         manifest=manifest, options=options, srcsets=srcsets)
+            if precompress:
+                precompress_outputs(output_dir, jobs=jobs)
+        except Exception:
+            traceback.print_exc()
+            print("Error: build failed, waiting for the next change")
+            return manifest, False
+        return manifest, True
+    
+    manifest, _ = rebuild(None)
+    print(f"Watching {content_dir} for changes (Ctrl+C to stop)")
+    
+    try:
+        while True:
+            changed = watcher.wait()
+            # The output directory may live inside the content directory
+            changed = {path for path in changed
+                       if not path.startswith(output_dir + os.sep) and path != output_dir + os.sep}
+            
+            # Directory events and lost events can hide any kind of file
+            dir_events = any(path.endswith(os.sep) for path in changed)
+            posts_changed = dir_events or any(path.endswith('.md') for path in changed)
+            images_changed = dir_events or any(is_image_file(path) for path in changed)
+            if not posts_changed and not images_changed:
+                continue
+            
+            start = time.time()
+            reset_output_counts()
+            if images_changed:
+                try:
+                    images = copy_image_files(content_dir, output_dir)
+                    srcsets = process_responsive_images(images, output_dir, options, jobs=jobs, cache=cache)
+                except (ImageCollisionError, OSError) as e:
+                    print(f"Error: {e}")
+            # Posts showing an image with new or removed variants are rewritten too
+            manifest, ok = rebuild(manifest)
+            if ok:
+                print(f"Rebuilt in {time.time() - start:.2f}s "
+                      f"({output_counts['written']} written, {output_counts['skipped']} unchanged)")
+    except KeyboardInterrupt:
+        print("Stopped watching")
+    finally:
+        watcher.close()
+
+class PreviewSite:
+    """Renders pages of a content directory on demand for the preview server
+    
+    Post metadata is scanned on the first request, and each page is only
+    rendered the first time it is requested. Rendered pages live in a small
+    LRU that is invalidated when their sources change.
+    """
+    
+    def __init__(self, content_dir, site_name, cache=None, max_pages=PREVIEW_PAGE_CACHE_SIZE):
+        self.content_dir = content_dir
+        self.site_name = site_name
+        self.cache = cache
+        self.max_pages = max_pages
+        self.lock = threading.RLock()
+        self.posts = None
+        self.posts_by_url = {}
+        self.post_links = None
+        self.sidebar = None
+        self.images = None
+        self.pages = OrderedDict()
+        
+        # Bumped on every change, browsers waiting on live reload watch it
+        self.version = 0
+        self.changed = threading.Condition()
+    
+    def get_posts(self):
+        """Return post metadata, scanning the content directory if needed"""
+        with self.lock:
+            if self.posts is None:
+                self.posts = scan_posts(self.content_dir)
+                self.posts_by_url = {post.url: post for post in reversed(self.posts)}
+                self.post_links = PostLinks(self.posts)
+                self.sidebar = sidebar_digest(self.posts)
+            return self.posts
+    
+    def render_page(self, url):
+        """Return (content type, body) for a generated page, or None if there is none"""
+        posts = self.get_posts()
         
-        with open(post_path, 'w', encoding='utf-8') as f:
-            f.write(generate_post_html(post, posts, site_name))
+        if url == '/':
+            index_posts = [render_scanned_post(posts[0], self.cache)] + posts[1:] if posts else posts
+            return 'text/html', generate_index_html(index_posts, self.site_name, self.post_links)
+        if url == '/feed.xml':
+            rendered = [render_scanned_post(post, self.cache) for post in posts]
+            return 'application/rss+xml', generate_rss_feed(rendered, self.site_name)
+        for name, content in STATIC_ASSETS.items():
+            if url == asset_url(name):
+                return mimetypes.guess_type(name)[0], content
         
-        print(f"Generated: {post_path}")
+        post = self.posts_by_url.get(url)
+        if post is None:
+            return None
+        return 'text/html', generate_post_html(render_scanned_post(post, self.cache), posts,
+                                               self.site_name, self.post_links)
     
-    # Write index file
-    index_path = os.path.join(output_dir, 'index.html')
-    with open(index_path, 'w', encoding='utf-8') as f:
-        f.write(generate_index_html(posts, site_name))
+    def get_page(self, url):
+        """Return (content type, body bytes) for url from the page LRU, rendering on a miss"""
+        with self.lock:
+            if url in self.pages:
+                self.pages.move_to_end(url)
+                return self.pages[url]
+            
+            page = self.render_page(url)
+            if page is None:
+                return None
+            
+            content_type, body = page
+            if content_type == 'text/html':
+                body = body.replace('</body>', LIVE_RELOAD_SCRIPT + '</body>', 1)
+            page = (content_type, body.encode('utf-8'))
+            
+            self.pages[url] = page
+            if len(self.pages) > self.max_pages:
+                self.pages.popitem(last=False)
+            return page
     
-    print(f"Generated: {index_path}")
+    def find_image(self, name):
+        """Return the source path of an image served under /img/, or None"""
+        with self.lock:
+            if self.images is None:
+                self.images = {}
+                for root, _, files in os.walk(self.content_dir):
+                    for file in files:
+                        if is_image_file(file):
+                            self.images[file] = os.path.join(root, file)
+            return self.images.get(name)
     
-    # Write RSS feed
-    rss_path = os.path.join(output_dir, 'feed.xml')
-    with open(rss_path, 'w', encoding='utf-8') as f:
-        f.write(generate_rss_feed(posts, site_name))
+    def invalidate(self, changed_paths):
+        """Drop whatever depends on the changed files and tell browsers to reload"""
+        with self.lock:
+            self.images = None
+            if self.posts is not None:
+                old_posts_by_url = self.posts_by_url
+                old_sidebar = self.sidebar
+                self.posts = None
+                try:
+                    self.get_posts()
+                except Exception:
+                    # E.g. a post saved halfway through an edit. posts stays unset,
+                    # so the next request scans again and shows the error
+                    traceback.print_exc()
+                    self.pages.clear()
+                else:
+                    if self.sidebar != old_sidebar:
+                        # Every page shows the post list
+                        self.pages.clear()
+                    else:
+                        changed = {os.path.abspath(path) for path in changed_paths}
+                        stale = {'/', '/feed.xml'} | {
+                            url for url, post in old_posts_by_url.items() if post.source_path in changed
+                        }
+                        for url in stale:
+                            self.pages.pop(url, None)
+        
+        with self.changed:
+            self.version += 1
+            self.changed.notify_all()
+    
+    def wait_for_change(self, version, timeout):
+        """Wait until the site changes past version; return the current version"""
+        with self.changed:
+            self.changed.wait_for(lambda: self.version != version, timeout)
+            return self.version
+
+class PreviewRequestHandler(BaseHTTPRequestHandler):
+    """Serves a PreviewSite, set as the site attribute of a subclass"""
+    
+    site = None
+    
+    def do_GET(self):
+        url = urllib.parse.unquote(urllib.parse.urlsplit(self.path).path)
+        
+        if url == LIVE_RELOAD_PATH:
+            self.send_live_reload()
+            return
+        
+        if url.startswith('/img/'):
+            image_path = self.site.find_image(url[len('/img/'):])
+            if image_path is None:
+                self.send_error(404)
+                return
+            with open(image_path, 'rb') as f:
+                body = f.read()
+            content_type = mimetypes.guess_type(image_path)[0] or 'application/octet-stream'
+            self.send_body(content_type, body)
+            return
+        
+        # Post URLs always end in a slash, like the directories they are built into
+        if url.endswith('/index.html'):
+            url = url[:-len('index.html')]
+        if not url.endswith('/') and '.' not in os.path.basename(url):
+            url += '/'
+        
+        try:
+            page = self.site.get_page(url)
+        except Exception:
+            # Show the error instead of dropping the connection; the page reloads on the next change
+            error = traceback.format_exc()
+            print(error, end='')
+            body = PREVIEW_ERROR_TEMPLATE.format(error=html_lib.escape(error), live_reload=LIVE_RELOAD_SCRIPT)
+            self.send_body('text/html; charset=utf-8', body.encode('utf-8'), status=500)
+            return
+        if page is None:
+            self.send_error(404)
+            return
+        content_type, body = page
+        self.send_body(content_type + '; charset=utf-8', body)
+    
+    def send_body(self, content_type, body, status=200):
+        self.send_response(status)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(body)))
+        self.send_header('Cache-Control', 'no-cache')
+        self.end_headers()
+        self.wfile.write(body)
+    
+    def send_live_reload(self):
+        """Hold a server-sent events stream open and send a message on every change"""
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/event-stream')
+        self.send_header('Cache-Control', 'no-cache')
+        self.end_headers()
+        
+        version = self.site.version
+        try:
+            while True:
+                new_version = self.site.wait_for_change(version, timeout=15)
+                if new_version != version:
+                    version = new_version
+                    self.wfile.write(b"data: reload\n\n")
+                else:
+                    # Comment line so proxies and browsers keep the connection open
+                    self.wfile.write(b": keepalive\n\n")
+                self.wfile.flush()
+        except (BrokenPipeError, ConnectionResetError):
+            pass
+    
+    def log_message(self, format, *args):
+        if not self.path.startswith(LIVE_RELOAD_PATH):
+            super().log_message(format, *args)
+
+def serve(content_dir, site_name, host="127.0.0.1", port=8000, cache=None):
+    """Serve a live preview of content_dir, rendering pages as they are requested"""
+    site = PreviewSite(content_dir, site_name, cache=cache)
+    handler = type('Handler', (PreviewRequestHandler,), {'site': site})
+    server = ThreadingHTTPServer((host, port), handler)
+    server.daemon_threads = True
+    
+    def watch_changes():
+        watcher = create_watcher(content_dir)
+        while True:
+            changed = watcher.wait()
+            print(f"Changed: {', '.join(sorted(os.path.relpath(p, content_dir) for p in changed))}")
+            # An error here must not end the thread, or no later change would reach the browsers
+            try:
+                site.invalidate(changed)
+            except Exception:
+                traceback.print_exc()
     
-    print(f"Generated: {rss_path}")
+    threading.Thread(target=watch_changes, daemon=True).start()
     
-    # Write style.css
-    css_path = os.path.join(output_dir, 'style.css')
-    with open(css_path, 'w', encoding='utf-8') as f:
-        f.write(STYLE_CSS)
+    print(f"Serving {content_dir} at http://{host}:{port}/ (Ctrl+C to stop)")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        print("Stopped server")
+    finally:
+        server.server_close()
+
+def serve_command(argv):
+    """Handle the 'serve' subcommand"""
+    parser = argparse.ArgumentParser(prog="credcast.py serve",
+                                     description="Preview a credcast site, rendering pages on demand")
+    parser.add_argument("content_dir", help="Directory containing markdown files")
+    parser.add_argument("--site-name", help="Subdomain name (default: derived from content_dir)")
+    parser.add_argument("--host", default="127.0.0.1", help="Address to listen on")
+    parser.add_argument("--port", type=int, default=8000, help="Port to listen on")
+    parser.add_argument("--cache-dir", default=default_cache_dir(), help="Render cache directory")
+    parser.add_argument("--no-cache", action="store_true", help="Render every post without the render cache")
+    parser.add_argument("--unlabeled-code", type=unlabeled_code_policy, default="guess", metavar="POLICY",
+                        help="Highlight code blocks without a language: guess, plain or a language name (default: guess)")
+    
+    args = parser.parse_args(argv)
+    content_dir = os.path.abspath(args.content_dir)
+    site_name = args.site_name if args.site_name else os.path.basename(content_dir)
+    set_unlabeled_code(args.unlabeled_code)
+    cache = None if args.no_cache else RenderCache(args.cache_dir)
+    
+    serve(content_dir, site_name, args.host, args.port, cache)
+
+# Build bookkeeping in the output directory that is never deployed
+DEPLOY_EXCLUDES = (MANIFEST_FILE, IMAGE_INDEX_FILE, DEPLOY_STATE_FILE, FEED_ITEMS_FILE)
+
+def deploy_target(server, remote_path):
+    """Return the rsync destination for a deploy; an empty server means a local directory"""
+    return f"{server}:{remote_path}" if server else remote_path
+
+def load_deploy_state(output_dir):
+    """Load {target: {path: [sha256, size, mtime_ns]}} recorded by previous deploys"""
+    try:
+        with open(os.path.join(output_dir, DEPLOY_STATE_FILE), 'r', encoding='utf-8') as f:
+            state = json.load(f)
+    except (OSError, ValueError):
+        return {}
+    if state.get('version') != DEPLOY_STATE_VERSION:
+        return {}
+    return state.get('targets', {})
+
+def save_deploy_state(output_dir, targets):
+    """Atomically write the deploy state"""
+    state_path = os.path.join(output_dir, DEPLOY_STATE_FILE)
+    tmp_path = f"{state_path}.{os.getpid()}.tmp"
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump({'version': DEPLOY_STATE_VERSION, 'targets': targets}, f)
+    os.replace(tmp_path, state_path)
+
+def scan_deploy_files(output_dir, previous):
+    """Return {path: [sha256, size, mtime_ns]} for every file to deploy
     
-    print(f"Generated: {css_path}")
+    Files with the size and mtime recorded in previous keep its hash
+    instead of being read again; unchanged outputs keep their mtime.
+    """
+    files = {}
+    for root, dirs, names in os.walk(output_dir):
+        dirs.sort()
+        for name in sorted(names):
+            file_path = os.path.join(root, name)
+            rel_path = os.path.relpath(file_path, output_dir).replace(os.sep, '/')
+            if rel_path in DEPLOY_EXCLUDES:
+                continue
+            st = os.stat(file_path)
+            entry = previous.get(rel_path)
+            if entry is None or entry[1] != st.st_size or entry[2] != st.st_mtime_ns:
+                entry = [hash_file(file_path), st.st_size, st.st_mtime_ns]
+            files[rel_path] = entry
+    return files
+
+def deploy_changes(previous, files):
+    """Return the (changed, deleted) paths between a recorded deploy state and the current files"""
+    changed = [rel_path for rel_path, entry in files.items()
+               if rel_path not in previous or previous[rel_path][0] != entry[0]]
+    deleted = sorted(rel_path for rel_path in previous if rel_path not in files)
+    return changed, deleted
+
+def rsync_output(output_dir, dest, changes=None, link_dest=None):
+    """Copy the output directory to an rsync destination, returning rsync's exit status
     
-    # Write scripts.js
-    js_path = os.path.join(output_dir, 'scripts.js')
-    with open(js_path, 'w', encoding='utf-8') as f:
-        f.write(SCRIPTS_JS)
+    With changes, only those (changed, deleted) paths are sent. Otherwise
+    rsync compares the whole tree, hardlinking files that are unchanged
+    from link_dest when one is given.
+    """
+    if changes is None:
+        cmd = ["rsync", "-avz", "--delete", "--progress"]
+        for name in DEPLOY_EXCLUDES:
+            cmd += ["--exclude", name]
+        if link_dest is not None:
+            cmd.append(f"--link-dest={link_dest}")
+        cmd += [f"{output_dir}/", f"{dest}/"]
+        return subprocess.run(cmd).returncode
     
-    print(f"Generated: {js_path}")
+    changed, deleted = changes
+    print(f"Sending {len(changed)} changed files, deleting {len(deleted)}")
+    # Listed files missing from the output are deleted on the target
+    cmd = ["rsync", "-avz", "--progress", "--from0", "--files-from=-", "--delete-missing-args",
+           f"{output_dir}/", f"{dest}/"]
+    file_list = ''.join(f"{rel_path}\0" for rel_path in changed + deleted)
+    return subprocess.run(cmd, input=file_list.encode('utf-8')).returncode
+
+def run_on_target(server, command, capture=False):
+    """Run a shell command on the deploy server, or locally when server is empty"""
+    cmd = ["ssh", server, command] if server else ["sh", "-c", command]
+    return subprocess.run(cmd, capture_output=capture, text=True)
 
-def deploy_to_server(output_dir, site_name, server="root@YOUR_DIGITAL_OCEAN_IP", remote_path=None):
-    """Deploy the site to the server using rsync"""
+def deploy_to_server(output_dir, site_name, server="root@YOUR_DIGITAL_OCEAN_IP", remote_path=None, full=False,
+                     releases=0):
+    """Deploy the site to the server using rsync, sending only what changed since the last deploy
+    
+    With releases, deploys a new release directory instead, see deploy_release().
+    Returns whether the deploy succeeded.
+    """
     if remote_path is None:
         remote_path = f"/var/www/{site_name}"
+    if releases:
+        return deploy_release(output_dir, site_name, server, remote_path, releases, full)
     
-    cmd = [
-        "rsync", "-avz", "--delete", "--progress",
-        f"{output_dir}/",
-        f"{server}:{remote_path}/"
-    ]
+    target = deploy_target(server, remote_path)
+    targets = load_deploy_state(output_dir)
+    previous = None if full else targets.get(target)
+    files = scan_deploy_files(output_dir, previous or {})
+    
+    print(f"Deploying to {target}...")
+    changes = None
+    if previous is not None:
+        changes = deploy_changes(previous, files)
+        if not any(changes):
+            print("Nothing changed since the last deploy")
+            return True
     
-    print(f"Deploying to {server}:{remote_path}...")
-    subprocess.run(cmd)
+    status = rsync_output(output_dir, target, changes)
+    if status != 0:
+        print(f"Error: rsync failed with exit status {status}")
+        return False
+    
+    targets[target] = files
+    save_deploy_state(output_dir, targets)
     print(f"Deployment complete! Site is live at https://{site_name}/")
+    return True
+
+def list_releases(server, remote_path):
+    """Return (release ids oldest first, id of the current release or None) on a deploy target"""
+    quoted = shlex.quote(remote_path)
+    # "/" cannot be a file name, so it separates the listing from the link
+    result = run_on_target(server, f"ls -1 {quoted}/releases 2>/dev/null; echo /; readlink {quoted}/current || true",
+                           capture=True)
+    if result.returncode != 0:
+        return [], None
+    lines = result.stdout.splitlines()
+    split = lines.index('/') if '/' in lines else len(lines)
+    release_ids = sorted(line for line in lines[:split] if line)
+    current = ''.join(lines[split + 1:]).strip()
+    return release_ids, (os.path.basename(current) if current else None)
+
+def switch_release(server, remote_path, release):
+    """Atomically point remote_path/current at a release directory"""
+    quoted = shlex.quote(remote_path)
+    link = shlex.quote(f"releases/{release}")
+    # rename() replaces the old link in one step, so readers never see a missing or half-made site
+    return run_on_target(server, f"cd {quoted} && ln -sfn {link} current.tmp && mv -T current.tmp current").returncode == 0
+
+def deploy_release(output_dir, site_name, server, remote_path, keep, full=False):
+    """Deploy the site as a new release directory and switch the current link to it
+    
+    The web server serves remote_path/current, a symlink to one directory
+    in remote_path/releases/. A new release starts as a hardlinked copy of
+    the current one, so only changed files take new space and only they are
+    sent; the link is then switched in one rename. The newest keep releases
+    stay on the server for rollback_release().
+    """
+    target = deploy_target(server, remote_path)
+    release_ids, current = list_releases(server, remote_path)
+    targets = load_deploy_state(output_dir)
+    current_target = f"{target}/releases/{current}" if current else None
+    previous = None if full or current is None else targets.get(current_target)
+    files = scan_deploy_files(output_dir, previous or {})
+    
+    changes = None
+    if previous is not None:
+        changes = deploy_changes(previous, files)
+        if not any(changes):
+            print(f"Nothing changed since release {current}")
+            return True
+    
+    release = time.strftime('%Y%m%d-%H%M%S', time.gmtime())
+    if release in release_ids:
+        print(f"Error: release {release} already exists on {target}")
+        return False
+    releases_dir = shlex.quote(f"{remote_path}/releases")
+    release_dir = f"{remote_path}/releases/{release}"
+    release_target = f"{target}/releases/{release}"
+    print(f"Deploying release {release} to {target}...")
+    
+    if changes is not None:
+        # Start from hardlinks to the current release; rsync replaces changed files instead of writing through the links
+        prepared = run_on_target(server, f"cp -al {releases_dir}/{shlex.quote(current)} {shlex.quote(release_dir)}")
+        link_dest = None
+    else:
+        prepared = run_on_target(server, f"mkdir -p {releases_dir}")
+        # Relative to the new release directory
+        link_dest = f"../{current}" if current else None
+    if prepared.returncode != 0:
+        print(f"Error: could not create {release_target}")
+        return False
+    
+    status = rsync_output(output_dir, release_target, changes, link_dest)
+    if status != 0:
+        print(f"Error: rsync failed with exit status {status}")
+        run_on_target(server, f"rm -rf {shlex.quote(release_dir)}")
+        return False
+    if not switch_release(server, remote_path, release):
+        print(f"Error: could not switch {target}/current to release {release}")
+        return False
+    
+    # Drop the oldest releases, and what was recorded about them
+    release_ids.append(release)
+    expired = release_ids[:-keep]
+    if expired:
+        run_on_target(server, "rm -rf " + " ".join(
+            shlex.quote(f"{remote_path}/releases/{old}") for old in expired))
+    for old in expired:
+        targets.pop(f"{target}/releases/{old}", None)
+    targets[release_target] = files
+    save_deploy_state(output_dir, targets)
+    print(f"Deployment complete! Release {release} is live at https://{site_name}/")
+    return True
+
+def rollback_release(server, remote_path, release=None):
+    """Point remote_path/current back at an earlier release, by default the one before the current one
+    
+    Returns whether the rollback succeeded.
+    """
+    target = deploy_target(server, remote_path)
+    release_ids, current = list_releases(server, remote_path)
+    if release is None:
+        older = [old for old in release_ids if current is None or old < current]
+        if not older:
+            print(f"Error: no release older than {current} on {target}")
+            return False
+        release = older[-1]
+    elif release not in release_ids:
+        print(f"Error: no release {release} on {target} (releases: {', '.join(release_ids) or 'none'})")
+        return False
+    
+    if not switch_release(server, remote_path, release):
+        print(f"Error: could not switch {target}/current to release {release}")
+        return False
+    print(f"Rolled back {target} from release {current} to {release}")
+    return True
+
+def rollback_command(argv):
+    """Handle the 'rollback' subcommand"""
+    parser = argparse.ArgumentParser(prog="credcast.py rollback",
+                                     description="Switch a site deployed with --releases back to an earlier release")
+    parser.add_argument("site_name", help="Subdomain name")
+    parser.add_argument("--server", default="root@YOUR_DIGITAL_OCEAN_IP",
+                        help="Server to deploy to (empty for a local directory)")
+    parser.add_argument("--remote-path", default="/var/www/{site_name}",
+                        help="Remote path template (use {site_name} as placeholder)")
+    parser.add_argument("--to", dest="release", help="Release to switch to (default: the one before the current one)")
+    
+    args = parser.parse_args(argv)
+    remote_path = args.remote_path.format(site_name=args.site_name)
+    if not rollback_release(args.server, remote_path, args.release):
+        sys.exit(1)
+
+def cache_command(argv):
+    """Handle the 'cache stats|gc|clear' subcommand"""
+    parser = argparse.ArgumentParser(prog="credcast.py cache", description="Manage the credcast render cache")
+    parser.add_argument("action", choices=["stats", "gc", "clear"], help="Cache operation to run")
+    parser.add_argument("--cache-dir", default=default_cache_dir(), help="Render cache directory")
+    parser.add_argument("--cache-size", type=int, default=DEFAULT_CACHE_SIZE_MB,
+                        help="Maximum render cache size in MB")
+    
+    args = parser.parse_args(argv)
+    cache = RenderCache(args.cache_dir, args.cache_size * 1024 * 1024)
+    
+    if args.action == "stats":
+        entries = cache.entries()
+        size = sum(e[1] for e in entries)
+        stats = cache.load_stats()
+        hits = stats.get('total_hits', 0)
+        misses = stats.get('total_misses', 0)
+        lookups = hits + misses
+        
+        print(f"Cache directory: {cache.cache_dir}")
+        print(f"Entries: {len(entries)}")
+        print(f"Size: {size / (1024 * 1024):.1f} MB of {args.cache_size} MB")
+        if 'last_hits' in stats:
+            print(f"Last build: {stats['last_hits']} hits, {stats['last_misses']} misses")
+        print(f"Total: {hits} hits, {misses} misses"
+              + (f" ({100.0 * hits / lookups:.1f}% hit rate)" if lookups else ""))
+    elif args.action == "gc":
+        removed, freed = cache.gc()
+        print(f"Removed {removed} entries ({freed / (1024 * 1024):.1f} MB)")
+    elif args.action == "clear":
+        cache.clear()
+        print(f"Cleared render cache at {cache.cache_dir}")
 
 def main():
+    if len(sys.argv) > 1 and sys.argv[1] == "cache":
+        cache_command(sys.argv[2:])
+        return
+    if len(sys.argv) > 1 and sys.argv[1] == "serve":
+        serve_command(sys.argv[2:])
+        return
+    if len(sys.argv) > 1 and sys.argv[1] == "rollback":
+        rollback_command(sys.argv[2:])
+        return
+    
     parser = argparse.ArgumentParser(description="credcast - Simple static site generator for cred.at blogs")
     parser.add_argument("content_dir", help="Directory containing markdown files")
     parser.add_argument("--site-name", help="Subdomain name (default: derived from content_dir)")
@@ -808,6 +3569,46 @@ def main():
     parser.add_argument("--remote-path", default="/var/www/{site_name}",
                         help="Remote path template (use {site_name} as placeholder)")
     parser.add_argument("--dry-run", action="store_true", help="Build locally without deploying")
+    parser.add_argument("--full-deploy", action="store_true",
+                        help="Let rsync compare the whole site instead of sending only the files changed since the last deploy")
+    parser.add_argument("--releases", type=int, default=0, metavar="N",
+                        help="Deploy into a new release directory, switch the current link to it and keep the last N releases")
+    parser.add_argument("--jobs", "-j", type=int, default=1,
+                        help="Number of worker processes for rendering posts (0 = one per CPU core)")
+    parser.add_argument("--cache-dir", default=default_cache_dir(), help="Render cache directory")
+    parser.add_argument("--cache-size", type=int, default=DEFAULT_CACHE_SIZE_MB,
+                        help="Maximum render cache size in MB")
+    parser.add_argument("--no-cache", action="store_true", help="Render every post without the render cache")
+    parser.add_argument("--stream", action="store_true",
+                        help="Render, write and drop one post at a time to keep memory use bounded")
+    parser.add_argument("--incremental", action="store_true",
+                        help="Only rebuild pages whose sources changed since the last build")
+    parser.add_argument("--watch", action="store_true",
+                        help="Keep running and rebuild incrementally whenever content changes")
+    parser.add_argument("--shared-nav", action="store_true",
+                        help=f"Write the post list once to /{NAV_FILE} instead of into every page")
+    parser.add_argument("--page-size", type=int, default=0,
+                        help="Posts per page of the paginated /page/N/ and yearly listings (default: no listings)")
+    parser.add_argument("--sidebar-limit", type=int, default=0,
+                        help="Show only the most recent N posts in the sidebar, plus an archive link")
+    parser.add_argument("--feed-limit", type=int, default=0,
+                        help="Only put the most recent N posts in feed.xml (default: all)")
+    parser.add_argument("--feed-summary", action="store_true",
+                        help="Only put the first paragraph of each post in feed.xml")
+    parser.add_argument("--responsive-images", action="store_true",
+                        help="Add resized variants of JPEG and PNG images to posts through srcset (needs Pillow)")
+    parser.add_argument("--image-widths", default=DEFAULT_IMAGE_WIDTHS,
+                        help=f"Comma separated widths of the resized images (default: {DEFAULT_IMAGE_WIDTHS})")
+    parser.add_argument("--server-highlight", action="store_true",
+                        help="Style code blocks with a Pygments stylesheet instead of loading highlight.js")
+    parser.add_argument("--precompress", action="store_true",
+                        help="Write .gz (and .br, with the brotli module) siblings of every text output")
+    parser.add_argument("--image-format", choices=["webp", "jpeg"], default="webp",
+                        help="Format of the resized images (default: webp)")
+    parser.add_argument("--unlabeled-code", type=unlabeled_code_policy, default="guess", metavar="POLICY",
+                        help="Highlight code blocks without a language: guess, plain or a language name (default: guess)")
+    parser.add_argument("--highlight-stats", action="store_true",
+                        help="Report the blocks and time spent in each Pygments lexer")
     
     args = parser.parse_args()
     
@@ -832,21 +3633,73 @@ def main():
     # Create output directory
     os.makedirs(output_dir, exist_ok=True)
     
-    # Process markdown files
-    posts = process_markdown_files(content_dir)
-    print(f"Found {len(posts)} posts")
+    # Before the render cache, whose keys depend on it
+    set_unlabeled_code(args.unlabeled_code)
+    cache = None if args.no_cache else RenderCache(args.cache_dir, args.cache_size * 1024 * 1024)
+    options = BuildOptions.from_args(args)
     
     # Copy images
-    copy_image_files(content_dir, output_dir)
+    try:
+        images = copy_image_files(content_dir, output_dir)
+    except ImageCollisionError as e:
+        print(f"Error: {e}")
+        sys.exit(1)
+    srcsets = process_responsive_images(images, output_dir, options, jobs=args.jobs, cache=cache)
+    if not args.precompress:
+        # Clean up after a previous build with --precompress
+        remove_compressed_siblings(output_dir)
+    
+    # Process markdown files
+    if args.watch:
+        watch(content_dir, output_dir, site_name, jobs=args.jobs, cache=cache, options=options, srcsets=srcsets,
+              precompress=args.precompress)
+        if cache is not None:
+            cache.gc()
+            cache.save_stats()
+        return
+    
+    if args.incremental:
+        # Compare against the previous build's manifest and write only what changed
+        build_incremental(content_dir, output_dir, site_name, jobs=args.jobs, cache=cache, options=options,
+                          srcsets=srcsets)
+    else:
+        if args.stream:
+            # Only metadata is collected up front, bodies are rendered while writing
+            posts = scan_posts(content_dir)
+        else:
+            posts = process_markdown_files(content_dir, jobs=args.jobs, cache=cache)
+        print(f"Found {len(posts)} posts")
+        
+        # Write output files
+        if args.stream:
+            write_output_files_streaming(output_dir, posts, site_name, jobs=args.jobs, cache=cache,
+                                         options=options, srcsets=srcsets)
+        else:
+            write_output_files(output_dir, posts, site_name, options, cache, srcsets)
     
-    # Write output files
-    write_output_files(output_dir, posts, site_name)
+    if args.precompress:
+        precompress_outputs(output_dir, jobs=args.jobs)
+    print(f"Output: {output_counts['written']} files written, {output_counts['skipped']} unchanged")
+    if cache is not None:
+        print(f"Render cache: {cache.hits} hits, {cache.misses} misses")
+        if cache.fragment_hits or cache.fragment_misses:
+            print(f"Feed items: {cache.fragment_hits} cached, {cache.fragment_misses} generated")
+        if highlight_stats.hits or highlight_stats.misses:
+            print(f"Code blocks: {highlight_stats.hits} cached, {highlight_stats.misses} highlighted")
+        if cache.image_hits or cache.image_misses:
+            print(f"Image variants: {cache.image_hits} cached, {cache.image_misses} generated")
+        cache.gc()
+        cache.save_stats()
+    if args.highlight_stats:
+        print("Highlighting by lexer:")
+        highlight_stats.report()
     
     # Deploy if requested
     if args.deploy and not args.dry_run:
         # Format remote path with site_name
         remote_path = args.remote_path.format(site_name=site_name)
-        deploy_to_server(output_dir, site_name, args.server, remote_path)
+        if not deploy_to_server(output_dir, site_name, args.server, remote_path, args.full_deploy, args.releases):
+            sys.exit(1)
     elif args.dry_run:
         print(f"Dry run complete. Site built at {output_dir}")
     else: